@@ -3,19 +3,31 @@
 Download BIDDAYOFFER_D records for a list of DUIDs and save the 10 price-band
 columns for each trading day between **1 Nov 2019 and 31 Mar 2020**.
 
-Output: one CSV per calendar month in ./price_bands/, e.g.
-    price_bands/biddayoffer_november2019.csv
+Output: one zstd-compressed Parquet file per calendar month, laid out as a
+hive-partitioned dataset under ./price_bands/, e.g.
+    price_bands/table=BIDDAYOFFER_D/year=2019/month=11/part.parquet
+
+Months are cached by nemosis as typed Parquet and read back with pyarrow, so
+a rerun only re-reads a month whose cache is newer than its output and never
+re-downloads a cached month.  Months are independent and are processed in
+parallel, one worker process each.
 
 Dependencies:
-    pip install nemosis pandas
+    pip install nemosis pandas pyarrow
 """
 
+import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
 
 import pandas as pd
-from nemosis import dynamic_data_compiler
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from nemosis import cache_compiler
 
 # ── 1  Config ──────────────────────────────────────────────────────────────
 DUIDS = [
@@ -35,46 +47,158 @@ OUTPUT_DIR = Path("./price_bands")
 CACHE_DIR.mkdir(exist_ok=True)
 OUTPUT_DIR.mkdir(exist_ok=True)
 
+PRICE_COLUMNS = [f"PRICEBAND{i}" for i in range(1, 11)]
+
 SELECT_COLUMNS = [
     "SETTLEMENTDATE",    # Trading day date (00:00 local)
-    "BIDSETTLEMENTDATE", # Same but optional
     "OFFERDATE",         # Timestamp of file submission
     "DUID",
     "BIDTYPE",           # ENERGY, RAISE6SEC …
-] + [f"PRICEBAND{i}" for i in range(1, 11)]
+] + PRICE_COLUMNS
+
+# The typed nemosis cache keeps dates as "YYYY/MM/DD HH:MM:SS" text
+DATE_COLUMNS = ["SETTLEMENTDATE", "OFFERDATE"]
+DATE_FORMAT  = "%Y/%m/%d %H:%M:%S"
+
+# Storage types: dictionary-encoded keys, 32-bit price bands
+ARROW_TYPES = {
+    "DUID":    pa.dictionary(pa.int16(), pa.string()),
+    "BIDTYPE": pa.dictionary(pa.int16(), pa.string()),
+    **{c: pa.float32() for c in PRICE_COLUMNS},
+}
 
 # ── 2  Month iterator helper ──────────────────────────────────────────────
 
-def month_iter(start: datetime, end: datetime):
-    cur = start.replace(day=1, hour=0, minute=0, second=0)
-    while cur <= end:
-        next_month = (cur.replace(day=28) + timedelta(days=4)).replace(day=1)
-        yield cur, min(next_month - timedelta(minutes=5), end)
-        cur = next_month
+def month_iter(start: datetime, end: datetime) -> list:
+    """(month start, last 5-min interval of the month capped at end) pairs."""
+    starts = pd.date_range(start.replace(day=1, hour=0, minute=0, second=0),
+                           end, freq="MS")
+    ends = starts + pd.offsets.MonthBegin() - pd.Timedelta(minutes=5)
+    ends = ends.where(ends <= end, pd.Timestamp(end))
+    return list(zip(starts.to_pydatetime(), ends.to_pydatetime()))
+
+def previous_month(month_start: datetime) -> datetime:
+    """Start of the calendar month before month_start."""
+    return (pd.Timestamp(month_start) - pd.offsets.MonthBegin()).to_pydatetime()
+
+def trading_window(month_start: datetime, month_end: datetime) -> tuple:
+    """SETTLEMENTDATE bounds (start exclusive, end inclusive) for a month.
+
+    Same shift as nemosis' query_wrappers.dispatch_date_setup: trading days
+    begin at 04:00, so both bounds move back 4 h to midnight and the start
+    one more second, e.g. November is (30 Oct 23:59:59, 30 Nov 00:00] and
+    keeps the settlement dates 31 Oct to 30 Nov.
+    """
+    start = (pd.Timestamp(month_start) - pd.Timedelta(hours=4)).normalize()
+    end = (pd.Timestamp(month_end) - pd.Timedelta(hours=4)).normalize()
+    return ((start - pd.Timedelta(seconds=1)).to_pydatetime(),
+            end.to_pydatetime())
+
+def cache_pattern(month_start: datetime) -> str:
+    """Glob for the nemosis Parquet cache file(s) of the given month."""
+    return f"PUBLIC_DVD_{TABLE_NAME}_{month_start:%Y%m}010000*.parquet"
+
+def cache_files(month_start: datetime) -> list:
+    """Non-empty nemosis Parquet cache file(s) for the given month."""
+    return sorted(p for p in CACHE_DIR.glob(cache_pattern(month_start))
+                  if p.stat().st_size > 0)
+
+def read_cached_month(files: list, month_start: datetime,
+                      month_end: datetime) -> pa.Table:
+    """Read our DUIDs for the month's trading days straight from the cache."""
+    dataset = ds.dataset([str(p) for p in files], format="parquet")
+    schema = dataset.schema
+
+    # project only the wanted columns, typed on read
+    columns = {}
+    for col in SELECT_COLUMNS:
+        expr = pc.field(col)
+        if col in DATE_COLUMNS and not pa.types.is_timestamp(schema.field(col).type):
+            expr = pc.strptime(expr, format=DATE_FORMAT, unit="ns")
+        elif col in ARROW_TYPES:
+            expr = expr.cast(ARROW_TYPES[col])
+        columns[col] = expr
+
+    start, end = trading_window(month_start, month_end)
+    settlement = columns["SETTLEMENTDATE"]
+    table = dataset.to_table(
+        columns=columns,
+        filter=(pc.field("DUID").isin(DUIDS)
+                & (settlement > pa.scalar(start, pa.timestamp("ns")))
+                & (settlement <= pa.scalar(end, pa.timestamp("ns")))),
+    )
+    # drop the cache's pandas metadata, which describes the untyped columns
+    return table.replace_schema_metadata(None)
 
 # ── 3  Download loop ──────────────────────────────────────────────────────
-for month_start, month_end in month_iter(START_DATE, END_DATE):
-    label = month_start.strftime("%B%Y").lower()  # e.g. "november2019"
-    out_path = OUTPUT_DIR / f"biddayoffer_{label}.csv"
+def init_worker():
+    """Per-process setup: keep nemosis logging quiet in every worker."""
+    logging.getLogger("nemosis").setLevel(logging.WARNING)
 
-    if out_path.exists():
-        print(f"⚠️  {out_path.name} exists – skip")
-        continue
+def cache_month(month_start: datetime) -> list:
+    """Download one calendar month into the cache unless it is already there."""
+    label = month_start.strftime("%B%Y").lower()  # e.g. "november2019"
+    files = cache_files(month_start)
+    if files:
+        return files
 
+    # nemosis also fetches the previous month's file when start_time is
+    # exactly midnight on the 1st; start 5 min later so parallel workers
+    # never touch each other's files
     print(f"Fetching {TABLE_NAME} for {label} …")
-    df = dynamic_data_compiler(
-        start_time        = month_start.strftime("%Y/%m/%d %H:%M:%S"),
-        end_time          = month_end.strftime("%Y/%m/%d %H:%M:%S"),
+    month_end = (pd.Timestamp(month_start) + pd.offsets.MonthBegin()
+                 - pd.Timedelta(minutes=5)).to_pydatetime()
+    cache_compiler(
+        start_time        = (month_start + timedelta(minutes=5)).strftime(DATE_FORMAT),
+        end_time          = month_end.strftime(DATE_FORMAT),
         table_name        = TABLE_NAME,
         raw_data_location = str(CACHE_DIR),
-        select_columns    = SELECT_COLUMNS,
+        fformat           = "parquet",
+        rebuild           = False,
         keep_csv          = True,
     )
-
-    df = df[df["DUID"].isin(DUIDS)].reset_index(drop=True)
-    print(f"Rows kept: {len(df):,}")
-
-    df.to_csv(out_path, index=False)
+    files = cache_files(month_start)
+    if not files:
+        raise FileNotFoundError(
+            f"nemosis cached no {TABLE_NAME} data for {label}: nothing "
+            f"non-empty matches {CACHE_DIR / cache_pattern(month_start)}")
+    return files
+
+def process_month(window: tuple) -> Path:
+    """Filter and write one cached calendar month; returns the output path."""
+    month_start, month_end = window
+    label = month_start.strftime("%B%Y").lower()  # e.g. "november2019"
+    part_dir = (OUTPUT_DIR / f"table={TABLE_NAME}"
+                / f"year={month_start:%Y}" / f"month={month_start:%m}")
+    out_path = part_dir / "part.parquet"
+
+    # the first trading day of the month settles in the previous month's file
+    files = cache_files(previous_month(month_start)) + cache_files(month_start)
+
+    # skip unless the cache has been refreshed since the output was written
+    if out_path.exists() and (
+        out_path.stat().st_mtime >= max(p.stat().st_mtime for p in files)
+    ):
+        print(f"⚠️  {part_dir} exists – skip")
+        return out_path
+
+    print(f"Reading cached {TABLE_NAME} for {label} …")
+    table = read_cached_month(files, month_start, month_end)
+    print(f"Rows kept ({label}): {table.num_rows:,}")
+
+    part_dir.mkdir(parents=True, exist_ok=True)
+    pq.write_table(table, out_path, compression="zstd")
     print(f"Saved → {out_path}")
-
-print("\n✅ Finished downloading all months.")
+    return out_path
+
+# Months are independent, so each one runs in its own process: first every
+# month's cache (plus the month before START_DATE), then the outputs
+if __name__ == "__main__":
+    windows = month_iter(START_DATE, END_DATE)
+    months = [previous_month(windows[0][0])] + [start for start, _ in windows]
+    with ProcessPoolExecutor(max_workers=min(len(windows), os.cpu_count() or 1),
+                             initializer=init_worker) as pool:
+        list(pool.map(cache_month, months))
+        out_paths = list(pool.map(process_month, windows))
+
+    print(f"\n✅ Finished downloading all {len(out_paths)} months.")
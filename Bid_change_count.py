@@ -13,7 +13,12 @@ Assumes the folder structure:
 """
 
 from pathlib import Path
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
 import matplotlib.pyplot as plt
 from matplotlib.patches import Patch
 
@@ -38,46 +43,76 @@ DUIDS     = [
 BATTERIES = {"HPRG1", "HPRL1", "DALNTH01", "DALNTHL1", "LBBG1", "LBBL1"}
 # everything else treated as Thermal
 
+avail_cols = [f"BANDAVAIL{i}" for i in range(1, 11)]
+
+# columns are typed at parse time
+CSV_FORMAT = ds.CsvFileFormat(convert_options=pv.ConvertOptions(
+    column_types={"INTERVAL_DATETIME": pa.timestamp("ns"),
+                  **{c: pa.float32() for c in avail_cols}},
+))
+
 # ---------------------------------------------------------------------
-# 1.  Load & concatenate ------------------------------------------------
+# 1.  Load all months in one scan --------------------------------------
 # ---------------------------------------------------------------------
-def read_month(fname: Path) -> pd.DataFrame:
-    df = pd.read_csv(fname, parse_dates=["INTERVAL_DATETIME"])
-    df = df[df["DUID"].isin(DUIDS)]
-    return df
-
-frames = []
-for m in MONTHS:
-    fpath = DATA_DIR / f"bidperoffer_{m}.csv"
+paths = [DATA_DIR / f"bidperoffer_{m}.csv" for m in MONTHS]
+for fpath in paths:
     if not fpath.exists():
         raise FileNotFoundError(f"missing {fpath}")
-    frames.append(read_month(fpath))
 
-bids = pd.concat(frames, ignore_index=True)
-
-# Ensure numeric columns really are numeric
-avail_cols = [f"BANDAVAIL{i}" for i in range(1, 11)]
-bids[avail_cols] = bids[avail_cols].apply(pd.to_numeric, errors="coerce")
+# only the needed columns, and only rows for our DUIDs, are materialised;
+# the keys are dictionary-encoded in the scan and arrive as categoricals,
+# so grouping hashes integer codes, not strings
+KEY_TYPE = pa.dictionary(pa.int16(), pa.string())
+dataset = ds.dataset([str(p) for p in paths], format=CSV_FORMAT)
+bids = dataset.to_table(
+    columns={"INTERVAL_DATETIME": pc.field("INTERVAL_DATETIME"),
+             "DUID":    pc.field("DUID").cast(KEY_TYPE),
+             "BIDTYPE": pc.field("BIDTYPE").cast(KEY_TYPE),
+             **{c: pc.field(c) for c in avail_cols}},
+    filter=pc.field("DUID").isin(DUIDS),
+).to_pandas()
+
+# Arrow dictionaries follow first appearance; sort the categories so the
+# code order (and hence the sort and summary order) is alphabetical
+for col in ("DUID", "BIDTYPE"):
+    bids[col] = bids[col].cat.reorder_categories(sorted(bids[col].cat.categories))
 
 # ---------------------------------------------------------------------
 # 2.  Flag bid-curve changes -------------------------------------------
 # ---------------------------------------------------------------------
-bids.sort_values(["DUID", "BIDTYPE", "INTERVAL_DATETIME"], inplace=True)
-
-# compare each row with previous row within DUID×BIDTYPE
-diff = bids.groupby(["DUID", "BIDTYPE"])[avail_cols].diff()
-bids["Bid_change"] = diff.ne(0).any(axis=1).fillna(0).astype(int)
+# price_bands.py writes each month sorted by DUID, BIDTYPE, INTERVAL_DATETIME
+# and the months are scanned in order, so a stable two-key sort keeps time
+# ordered within each DUID×BIDTYPE; fall back to the full sort otherwise
+bids.sort_values(["DUID", "BIDTYPE"], kind="stable", inplace=True)
+
+# same_group[i] is True when row i+1 continues the DUID×BIDTYPE run of
+# row i (compared on the integer category codes)
+duid  = bids["DUID"].cat.codes.to_numpy()
+btype = bids["BIDTYPE"].cat.codes.to_numpy()
+same_group = (duid[1:] == duid[:-1]) & (btype[1:] == btype[:-1])
+
+t = bids["INTERVAL_DATETIME"].to_numpy()
+if (t[1:][same_group] < t[:-1][same_group]).any():
+    bids.sort_values(["DUID", "BIDTYPE", "INTERVAL_DATETIME"], inplace=True)
+
+# compare each row with the previous row on the contiguous band matrix;
+# the first row of each DUID×BIDTYPE has no previous bid to compare with
+arr = bids[avail_cols].to_numpy(dtype=np.float32)
+changed = np.zeros(len(bids), dtype=bool)
+changed[1:] = (arr[1:] != arr[:-1]).any(axis=1) & same_group
+bids["Bid_change"] = changed.astype(np.int8)
 
 # ---------------------------------------------------------------------
 # 3.  Build summary ----------------------------------------------------
 # ---------------------------------------------------------------------
 total_intervals = bids["INTERVAL_DATETIME"].nunique()
 
-summary = (bids.groupby(["DUID", "BIDTYPE"])
+summary = (bids.groupby(["DUID", "BIDTYPE"], sort=False, observed=True)
                  ["Bid_change"]
-                 .agg(Intervals      = lambda s: total_intervals,   # same for everyone
-                      Num_with_change= "sum")
+                 .sum()
+                 .rename("Num_with_change")
                  .reset_index())
+summary["Intervals"] = total_intervals            # same for everyone
 
 summary["Frequency"] = summary["Num_with_change"] / summary["Intervals"]
 
@@ -94,16 +129,17 @@ print(summary.head(12))
 # ---------------------------------------------------------------------
 # 4 . Plot — blue vs orange
 # ---------------------------------------------------------------------
-mean_freq = (summary.groupby(["DUID", "Tech"])["Frequency"]
+# Tech follows from DUID, so average over bid types per DUID only
+mean_freq = (summary.groupby("DUID", observed=True)["Frequency"]
                      .mean()
                      .sort_values())          # order for barh
 
-colors = ["tab:blue"  if tech == "Battery"
-          else "tab:orange"
-          for tech in mean_freq.index.get_level_values("Tech")]
+duids  = mean_freq.index.astype(str).to_numpy()
+colors = np.where(np.isin(duids, list(BATTERIES)), "tab:blue", "tab:orange")
 
 plt.figure(figsize=(10, 6))
-ax = mean_freq.plot(kind="barh", color=colors, edgecolor="black")
+ax = plt.gca()
+ax.barh(duids, mean_freq.to_numpy(), color=colors, edgecolor="black")
 
 ax.set_xlabel("Bid-change frequency  (share of 5-min intervals)")
 ax.set_title("Interval-to-interval bid-curve changes\nNov-2019 – Mar-2020 (SA)")
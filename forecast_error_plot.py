@@ -30,17 +30,21 @@ print()
 frames = []
 for fpath in forecast_files:
     print("Reading", fpath.name)
-    df = pd.read_csv(fpath, dtype=str)
-
-    # numeric columns
-    df["RRP"]    = df["RRP"].astype(float)
-    df["LAST_FC_RRP"] = df["LAST_FC_RRP"].astype(float)
+    # numeric columns are typed by the pyarrow parser
+    df = pd.read_csv(
+        fpath,
+        engine="pyarrow",
+        dtype={"SETTLEMENTDATE": str, "REGIONID": str,
+               "RRP": float, "LAST_FC_RRP": float},
+    )
 
-    # impose strict "M/D/YYYY H:MM" format
+    # impose strict "M/D/YYYY H:MM" format; repeated timestamps are
+    # parsed once via the lookup cache
     df["SETTLEMENTDATE"] = pd.to_datetime(
         df["SETTLEMENTDATE"].str.strip(),
         format="%m/%d/%Y %H:%M",
-        errors="coerce"
+        errors="coerce",
+        cache=True,
     )
     before = len(df)
     df = df.dropna(subset=["SETTLEMENTDATE"])
@@ -51,11 +55,16 @@ for fpath in forecast_files:
     frames.append(df)
 
 data = pd.concat(frames, ignore_index=True)
+# categorical regions: the SA1 filter compares integer codes, not strings
+data["REGIONID"] = data["REGIONID"].astype("category")
 print(f"\nCombined shape: {data.shape}\n")
 
 # ─── D. Adjust midnight timestamps to previous day ───────────────────────
-mask_midnight = (data["SETTLEMENTDATE"].dt.hour == 0) & (data["SETTLEMENTDATE"].dt.minute == 0)
-data.loc[mask_midnight, "SETTLEMENTDATE"] -= pd.Timedelta(days=1)
+# exact midnights are whole multiples of a day in int64 nanoseconds
+ns = data["SETTLEMENTDATE"].to_numpy(dtype="datetime64[ns]").view("i8")
+day_ns = 86_400_000_000_000
+shift = (ns % day_ns == 0).astype("i8") * day_ns
+data["SETTLEMENTDATE"] = (ns - shift).view("datetime64[ns]")
 
 # ─── E. Filter SA1 & compute errors ──────────────────────────────────────
 sa = data[data["REGIONID"] == "SA1"].copy()
@@ -64,21 +73,19 @@ sa["ABS_ERROR"] = sa["ERROR"].abs()
 
 # ─── F. Group by month for summary series ────────────────────────────────
 sa["MONTH"] = sa["SETTLEMENTDATE"].dt.to_period("M")
-monthly_mean  = sa.groupby("MONTH")["ABS_ERROR"].mean()
-monthly_p50   = sa.groupby("MONTH")["ABS_ERROR"].quantile(0.5)
-monthly_p90   = sa.groupby("MONTH")["ABS_ERROR"].quantile(0.9)
-monthly_price = sa.groupby("MONTH")["RRP"].mean()
+by_month = sa.groupby("MONTH", sort=True, observed=True)
+monthly = by_month.agg(mean_abs=("ABS_ERROR", "mean"), mean_rrp=("RRP", "mean"))
+monthly[["p50_abs", "p90_abs"]] = by_month["ABS_ERROR"].quantile([0.5, 0.9]).unstack()
 
 # convert PeriodIndex to Timestamp for plotting
-for idx in (monthly_mean, monthly_p50, monthly_p90, monthly_price):
-    idx.index = idx.index.to_timestamp()
+monthly.index = monthly.index.to_timestamp()
 
 # ─── G. Plot monthly series ──────────────────────────────────────────────
 plt.figure(figsize=(12, 5))
-plt.plot(monthly_mean.index,  monthly_mean.values,  marker="o", label="Mean |Error|")
-plt.plot(monthly_p50.index,   monthly_p50.values,   marker="o", label="Median |Error|")
-plt.plot(monthly_p90.index,   monthly_p90.values,   marker="o", label="90th Pct |Error|")
-plt.plot(monthly_price.index, monthly_price.values, linestyle="--", color="black",
+plt.plot(monthly.index, monthly["mean_abs"], marker="o", label="Mean |Error|")
+plt.plot(monthly.index, monthly["p50_abs"],  marker="o", label="Median |Error|")
+plt.plot(monthly.index, monthly["p90_abs"],  marker="o", label="90th Pct |Error|")
+plt.plot(monthly.index, monthly["mean_rrp"], linestyle="--", color="black",
          label="Mean Actual Price (RRP)")
 plt.title("SA1 – Monthly Forecast Error & Actual Price")
 plt.xlabel("Month")
@@ -100,8 +107,11 @@ plt.show()
 
 # ─── I. Log-Scale histogram ─────────────────────────
 fig, ax = plt.subplots(figsize=(10,6))
+# Bin counts are precomputed with NumPy and drawn as bars
+errors = sa["ERROR"].dropna().to_numpy()
 # Main histogram, linear scale
-ax.hist(sa["ERROR"], bins=100, edgecolor="gray")
+counts, edges = np.histogram(errors, bins=100)
+ax.bar(edges[:-1], counts, width=np.diff(edges), align="edge", edgecolor="gray")
 ax.set_title("Forecast Error Histogram – Full Range")
 ax.set_xlabel("Error ($/MWh)")
 ax.set_ylabel("Frequency")
@@ -111,8 +121,9 @@ ax.set_yscale("log", nonpositive="clip")
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 axins = inset_axes(ax, width="40%", height="30%", loc="upper right")
 # show only errors beyond ±10 $/MWh
-tails = sa["ERROR"][sa["ERROR"].abs() > 10]
-axins.hist(tails, bins=50, edgecolor="gray")
+tails = errors[np.abs(errors) > 10]
+counts, edges = np.histogram(tails, bins=50)
+axins.bar(edges[:-1], counts, width=np.diff(edges), align="edge", edgecolor="gray")
 axins.set_title("Tails: |Error|>10")
 axins.set_xticks([-50, -25, 0, 25, 50])
 
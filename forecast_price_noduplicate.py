@@ -2,6 +2,9 @@
 """
 Fetch and compare 2021 pre-dispatch forecast prices vs. actual dispatch prices
 for energy and all FCAS markets, saving deduplicated outputs under a "price_forecast" folder.
+
+Outputs are written as zstd-compressed Parquet (typed, with parsed timestamps);
+set WRITE_CSV = True to also emit the CSV copies for external consumers.
 """
 
 import logging
@@ -30,6 +33,29 @@ OUTPUT_DIR    = Path("price_forecast")
 for d in (NEMOSIS_CACHE, NEMSEER_CACHE, OUTPUT_DIR):
     d.mkdir(exist_ok=True)
 
+# Also write CSV copies next to the Parquet outputs
+WRITE_CSV = False
+
+DATE_COLUMNS = ["SETTLEMENTDATE", "DATETIME", "INTERVAL_DATETIME",
+                "RUN_DATETIME", "LASTCHANGED"]
+KEY_COLUMNS  = ["REGIONID"]  # stored dictionary-encoded
+
+
+def save_table(df: pd.DataFrame, path: Path) -> Path:
+    """Write df as Parquet (and optionally CSV); returns the Parquet path."""
+    df = df.copy()
+    for col in DATE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col])
+    for col in KEY_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    out = path.with_suffix(".parquet")
+    df.to_parquet(out, engine="pyarrow", compression="zstd", index=False)
+    if WRITE_CSV:
+        df.to_csv(path.with_suffix(".csv"), index=False)
+    return out
+
 # ─── 2. Cache actual dispatch prices via NEMOSIS ────────────────────────────
 
 print("Caching actual dispatch prices (energy + FCAS)…")
@@ -52,8 +78,7 @@ actual_price = nemosis.dynamic_data_compiler(
     keep_csv          = True
 )
 
-out_actual = OUTPUT_DIR / "actual_dispatch_price_2021.csv"
-actual_price.to_csv(out_actual, index=False)
+out_actual = save_table(actual_price, OUTPUT_DIR / "actual_dispatch_price_2021")
 print(f"Saved actual prices → {out_actual}")
 
 # ─── 3. Download raw forecast price CSVs via NEMSEER ────────────────────────
@@ -98,30 +123,31 @@ p5_price = compile_data(
 
 # ─── 5. Deduplicate so we keep only the last‐updated record per interval & region ─
 
-# For PD forecasts: group by DATETIME & REGIONID, keep the row with max LASTCHANGED
-if "LASTCHANGED" in pd_price.columns:
-    pd_price = (
-        pd_price
-        .sort_values(["DATETIME", "REGIONID", "LASTCHANGED"],
-                     ascending=[True, True, False])
-        .drop_duplicates(subset=["DATETIME", "REGIONID"], keep="first")
+def keep_last_changed(df: pd.DataFrame, time_col: str) -> pd.DataFrame:
+    """Keep the row with max LASTCHANGED per (time_col, REGIONID)."""
+    df = df.reset_index(drop=True)
+    df["REGIONID"] = df["REGIONID"].astype("category")
+    # compare int64 timestamps, not strings, if nemseer left LASTCHANGED untyped
+    df["LASTCHANGED"] = pd.to_datetime(df["LASTCHANGED"], errors="coerce", cache=True)
+    # missing LASTCHANGED ranks lowest, so such rows are only kept as a last resort
+    keep_idx = (
+        df["LASTCHANGED"].fillna(pd.Timestamp.min)
+          .groupby([df[time_col], df["REGIONID"]], sort=False, observed=True)
+          .idxmax()
     )
+    return df.loc[keep_idx.sort_values()]
 
-# For P5MIN forecasts: group by INTERVAL_DATETIME & REGIONID, keep max LASTCHANGED
+# For PD forecasts: group by DATETIME & REGIONID
+if "LASTCHANGED" in pd_price.columns:
+    pd_price = keep_last_changed(pd_price, "DATETIME")
+
+# For P5MIN forecasts: group by INTERVAL_DATETIME & REGIONID
 if "LASTCHANGED" in p5_price.columns:
-    p5_price = (
-        p5_price
-        .sort_values(["INTERVAL_DATETIME", "REGIONID", "LASTCHANGED"],
-                     ascending=[True, True, False])
-        .drop_duplicates(subset=["INTERVAL_DATETIME", "REGIONID"], keep="first")
-    )
+    p5_price = keep_last_changed(p5_price, "INTERVAL_DATETIME")
 
 # ─── 6. Save deduplicated forecast tables ──────────────────────────────────
 
-out_pd = OUTPUT_DIR / "last_forecast_predispatch_price_2021.csv"
-pd_price.to_csv(out_pd, index=False)
-
-out_p5 = OUTPUT_DIR / "last_forecast_p5min_price_2021.csv"
-p5_price.to_csv(out_p5, index=False)
+out_pd = save_table(pd_price, OUTPUT_DIR / "last_forecast_predispatch_price_2021")
+out_p5 = save_table(p5_price, OUTPUT_DIR / "last_forecast_p5min_price_2021")
 
 print(f"Saved deduplicated forecasts →\n  {out_pd}\n  {out_p5}")
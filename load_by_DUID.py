@@ -3,15 +3,22 @@
 Download unit-level cleared energy & FCAS volumes for 18 South-Australian generators
 2019-10-01 00:05 → 2020-03-31 00:00 (inclusive).
 
-Requires:  • nemosis  • pandas  • python-dateutil  • (optional) tqdm
+Requires:  • nemosis  • pandas  • pyarrow  • python-dateutil  • (optional) tqdm
 """
 
+import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from pathlib import Path
 from dateutil.relativedelta import relativedelta
 
-import pandas as pd
-from nemosis import dynamic_data_compiler
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from nemosis import cache_compiler
 
 # ──────────────────────────────────────────────────────────────────────────
 # 0.  User settings
@@ -40,6 +47,9 @@ FCAS_COLS = [
 ]
 NUMERIC_COLS = ["TOTALCLEARED"] + FCAS_COLS
 
+# Also write the CSV copy alongside the Parquet output
+WRITE_CSV = True
+
 # ──────────────────────────────────────────────────────────────────────────
 # 1.  Build a list of monthly [start, end) windows for pulling
 # ──────────────────────────────────────────────────────────────────────────
@@ -51,52 +61,131 @@ while cursor < PULL_END:
     cursor = next_month
 
 # ──────────────────────────────────────────────────────────────────────────
-# 2.  Pull DISPATCHLOAD chunk-by-chunk
+# 2.  Cache DISPATCHLOAD month-by-month as typed Parquet
 # ──────────────────────────────────────────────────────────────────────────
-chunks = []
-for s_dt, e_dt in windows:
+# What pd.to_numeric accepts; anything else in a text column becomes NaN
+NUMERIC_TEXT = r"^\s*[-+]?((\d+\.?\d*|\.\d+)([eE][-+]?\d+)?|inf|infinity|nan)\s*$"
+
+def to_float32(col: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Cast a volume column to float32 with pd.to_numeric(errors="coerce")
+    semantics: blank or malformed text becomes null instead of failing."""
+    if pa.types.is_string(col.type) or pa.types.is_large_string(col.type):
+        ok = pc.match_substring_regex(col, NUMERIC_TEXT, ignore_case=True)
+        col = pc.if_else(ok, pc.utf8_trim_whitespace(col), pa.scalar(None, col.type))
+    return pc.cast(col, pa.float32())
+
+def init_worker():
+    """Per-process setup: keep nemosis logging quiet in every worker."""
+    logging.getLogger("nemosis").setLevel(logging.WARNING)
+
+def cache_patterns(s_dt: datetime) -> list:
+    """Globs for the nemosis Parquet cache file(s) of the given month: one
+    PUBLIC_DVD file, or several numbered PUBLIC_ARCHIVE parts."""
+    return [f"PUBLIC_DVD_DISPATCHLOAD_{s_dt:%Y%m}010000*.parquet",
+            f"PUBLIC_ARCHIVE#DISPATCHLOAD#FILE*#{s_dt:%Y%m}010000*.parquet"]
+
+def cache_files(s_dt: datetime) -> list:
+    """Non-empty nemosis Parquet cache file(s) for the given month."""
+    return sorted(str(p) for pattern in cache_patterns(s_dt)
+                  for p in Path(RAW_CACHE).glob(pattern)
+                  if p.stat().st_size > 0)
+
+def cache_month(window: tuple) -> list:
+    """Cache one month of DISPATCHLOAD; returns its cache file(s)."""
+    s_dt, e_dt = window
     s_str = s_dt.strftime("%Y/%m/%d %H:%M:%S")
     e_str = e_dt.strftime("%Y/%m/%d %H:%M:%S")
     print(f"Fetching DISPATCHLOAD {s_str} → {e_str} …")
-    df = dynamic_data_compiler(
+    # nemosis caches every monthly file touching [start, end], plus the
+    # previous month when start is exactly midnight on the 1st; ask for a
+    # window strictly inside this month so workers never share a file
+    cache_compiler(
         table_name="DISPATCHLOAD",
-        start_time=s_str,
-        end_time=e_str,
+        start_time=(s_dt + timedelta(minutes=5)).strftime("%Y/%m/%d %H:%M:%S"),
+        end_time=(e_dt - timedelta(minutes=5)).strftime("%Y/%m/%d %H:%M:%S"),
         raw_data_location=RAW_CACHE,
+        fformat="parquet",
         keep_csv=True
     )
+    files = cache_files(s_dt)
+    if not files:
+        raise FileNotFoundError(
+            f"nemosis cached no DISPATCHLOAD data for {s_dt:%Y-%m}: nothing "
+            f"non-empty matches {' or '.join(cache_patterns(s_dt))} in {RAW_CACHE}")
+    return files
+
+# Months are independent downloads, so each one is cached in its own process
+if __name__ == "__main__":
+    with ProcessPoolExecutor(max_workers=min(len(windows), os.cpu_count() or 1),
+                             initializer=init_worker) as pool:
+        month_files = [f for files in pool.map(cache_month, windows) for f in files]
+
+    # ──────────────────────────────────────────────────────────────────────
+    # 3.  Scan the cache once & final tidy-up
+    # ──────────────────────────────────────────────────────────────────────
+    # The typed cache keeps SETTLEMENTDATE as "YYYY/MM/DD HH:MM:SS" text
+    settlement = pc.strptime(pc.field("SETTLEMENTDATE"),
+                             format="%Y/%m/%d %H:%M:%S", unit="ns")
+
+    # Keep only the 18 units of interest, within the exact [START_TS, END_TS]
+    # inclusive window; both filters are applied inside the Arrow scan
+    # DUID is dictionary-encoded so grouping hashes small integer codes
+    dataset = ds.dataset(month_files, format="parquet")
+    tbl = dataset.to_table(
+        columns={"SETTLEMENTDATE": settlement,
+                 "DUID": pc.field("DUID").cast(pa.dictionary(pa.int16(), pa.string())),
+                 **{col: pc.field(col) for col in NUMERIC_COLS}},
+        filter=(pc.field("DUID").isin(DUIDS)
+                & (settlement >= pa.scalar(START_TS, pa.timestamp("ns")))
+                & (settlement <= pa.scalar(END_TS, pa.timestamp("ns")))),
+    )
 
-    # Keep only the 18 units of interest
-    df = df[df["DUID"].isin(DUIDS)]
-    # Coerce numeric columns to float32 for memory efficiency
+    # Volumes to float32 for memory efficiency, on the filtered rows only;
+    # a malformed value becomes NaN rather than aborting the scan
     for col in NUMERIC_COLS:
-        if col in df.columns:
-            df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
-
-    chunks.append(df[["SETTLEMENTDATE", "DUID"] + NUMERIC_COLS])
-
-# ──────────────────────────────────────────────────────────────────────────
-# 3.  Concatenate & final tidy-up
-# ──────────────────────────────────────────────────────────────────────────
-raw = pd.concat(chunks, ignore_index=True)
-
-# Restrict to the exact [START_TS, END_TS] inclusive window
-mask = (raw["SETTLEMENTDATE"] >= START_TS) & (raw["SETTLEMENTDATE"] <= END_TS)
-raw = raw.loc[mask]
-
-# Aggregate by 5-minute interval and DUID (summing in the very rare case of duplicates)
-tidy = (
-    raw.groupby(["SETTLEMENTDATE", "DUID"], as_index=False)
-        .sum(numeric_only=True)
-        .rename(columns={"TOTALCLEARED": "ENERGY"})
-)
-
-# Optional: sort rows for easier reading
-tidy = tidy.sort_values(["SETTLEMENTDATE", "DUID"]).reset_index(drop=True)
+        tbl = tbl.set_column(tbl.schema.get_field_index(col), col,
+                             to_float32(tbl[col]))
+
+    # Aggregate by 5-minute interval and DUID (summing in the very rare case of duplicates);
+    # min_count=0 so an all-NaN group sums to 0.0, as pandas does
+    OUT_COLS = ["ENERGY"] + FCAS_COLS
+    skip_nulls = pc.ScalarAggregateOptions(min_count=0)
+    agg = (
+        tbl.group_by(["SETTLEMENTDATE", "DUID"])
+           .aggregate([(col, "sum", skip_nulls) for col in NUMERIC_COLS])
+           .select(["SETTLEMENTDATE", "DUID"] + [f"{col}_sum" for col in NUMERIC_COLS])
+           .rename_columns(["SETTLEMENTDATE", "DUID"] + OUT_COLS)
+    )
 
-# ──────────────────────────────────────────────────────────────────────────
-# 4.  Save
-# ──────────────────────────────────────────────────────────────────────────
-out_csv = "dispatchload_unit_energy_fcas_201910-202003.csv"
-tidy.to_csv(out_csv, index=False)
-print(f"\n✓ Saved {len(tidy):,} rows to {out_csv}")
+    # Optional: sort rows for easier reading (Arrow sorts DUID by its text,
+    # so decode the dictionary first)
+    agg = agg.set_column(1, "DUID", agg["DUID"].cast(pa.string()))
+    agg = agg.sort_by([("SETTLEMENTDATE", "ascending"), ("DUID", "ascending")])
+
+    # Arrow widens float32 sums to double; narrow them back for the output,
+    # and store DUID dictionary-encoded again
+    agg = agg.cast(pa.schema(
+        [("SETTLEMENTDATE", pa.timestamp("ns")),
+         ("DUID", pa.dictionary(pa.int16(), pa.string()))]
+        + [(col, pa.float32()) for col in OUT_COLS]
+    ))
+
+    # ──────────────────────────────────────────────────────────────────────
+    # 4.  Save
+    # ──────────────────────────────────────────────────────────────────────
+    # One Parquet row group per calendar month, so readers can skip months
+    out_parquet = "dispatchload_unit_energy_fcas_201910-202003.parquet"
+    month_edges = np.array([s_dt for s_dt, _ in windows] + [windows[-1][1]],
+                           dtype="datetime64[ns]")
+    bounds = np.searchsorted(agg["SETTLEMENTDATE"].to_numpy(), month_edges)
+    with pq.ParquetWriter(out_parquet, agg.schema, compression="zstd") as writer:
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            if hi > lo:
+                writer.write_table(agg.slice(lo, hi - lo))
+    print(f"\n✓ Saved {agg.num_rows:,} rows to {out_parquet}")
+
+    # The logit scripts still read the CSV copy
+    if WRITE_CSV:
+        out_csv = "dispatchload_unit_energy_fcas_201910-202003.csv"
+        agg.to_pandas().to_csv(out_csv, index=False)
+        print(f"✓ Saved {agg.num_rows:,} rows to {out_csv}")
@@ -13,9 +13,10 @@ folder layout (relative to this script):
 import pandas as pd
 import numpy as np
 from pathlib import Path
-from statsmodels.discrete.discrete_model import Logit
 import statsmodels.api as sm
 
+from pipeline import read_csv_cached, build_bidflags, grouped_rolling_sum, grouped_lead
+
 # -------------------------------------------------------------------
 # 0.  PARAMETERS & CONSTANTS
 # -------------------------------------------------------------------
@@ -31,6 +32,9 @@ DUIDS = [
     "BARKIPS1", "AGLHAL", "OSB-AG"
 ]
 BATTERIES = {"HPRG1","HPRL1","DALNTH01","DALNTHL1","LBBG1","LBBL1"}
+# one shared dictionary for every DUID key; sorted so categorical
+# order matches the old string order
+DUID_TYPE = pd.CategoricalDtype(sorted(DUIDS))
 
 ENERGY_COL   = "RRP"
 FORECAST_PRE = "FC_"
@@ -42,18 +46,19 @@ FCAS_MARKETS = ["RAISE6SEC","RAISE60SEC","RAISE5MIN","RAISEREG",
 # 1.  LOAD DISPATCHED MW  (energy + FCAS, SA only)
 # -------------------------------------------------------------------
 load_file = Path("LoadData")/"dispatchload_unit_energy_fcas_201911_202003.csv"
-load = (pd.read_csv(load_file, parse_dates=["SETTLEMENTDATE"])
+load = (read_csv_cached(load_file, parse_dates=["SETTLEMENTDATE"])
           .rename(columns={"SETTLEMENTDATE":"INTERVAL"}))
 load = load[load["DUID"].isin(DUIDS)].copy()
+load["DUID"] = load["DUID"].astype(DUID_TYPE)
 load.sort_values(["DUID","INTERVAL"], inplace=True)
 
 # -------------------------------------------------------------------
 # 2.  LOAD PRICES  (actual + PD-5 forecast)  -------------------------
 # -------------------------------------------------------------------
-price19 = pd.read_csv(Path("price_forecast")/"actual_forecast_2019.csv",
-                      parse_dates=["SETTLEMENTDATE"])
-price20 = pd.read_csv(Path("price_forecast")/"actual_forecast_2020.csv",
-                      parse_dates=["SETTLEMENTDATE"])
+price19 = read_csv_cached(Path("price_forecast")/"actual_forecast_2019.csv",
+                          parse_dates=["SETTLEMENTDATE"])
+price20 = read_csv_cached(Path("price_forecast")/"actual_forecast_2020.csv",
+                          parse_dates=["SETTLEMENTDATE"])
 price = pd.concat([price19, price20], ignore_index=True)
 price = price[price["REGIONID"]==REGION].rename(columns={"SETTLEMENTDATE":"INTERVAL"})
 
@@ -64,39 +69,19 @@ keep_cols = (["INTERVAL"]
              + [FORECAST_PRE+m+"RRP" for m in FCAS_MARKETS])
 price = price[keep_cols]
 
-# absolute forecast error
-price["Abs_FE_E"] = (price[ENERGY_COL] - price[FORECAST_PRE+ENERGY_COL]).abs()
-for m in FCAS_MARKETS:
-    price[f"Abs_FE_{m}"] = (price[m+"RRP"] - price[FORECAST_PRE+m+"RRP"]).abs()
+# absolute forecast error, all markets in one matrix op
+act_cols = [ENERGY_COL] + [m+"RRP" for m in FCAS_MARKETS]
+abs_fe = np.subtract(price[act_cols].to_numpy(),
+                     price[[FORECAST_PRE+c for c in act_cols]].to_numpy())
+np.abs(abs_fe, out=abs_fe)
+price[["Abs_FE_E"] + [f"Abs_FE_{m}" for m in FCAS_MARKETS]] = abs_fe
 
 # -------------------------------------------------------------------
 # 3.  BUILD BID-CHANGE FLAGS  ----------------------------------------
 # -------------------------------------------------------------------
-def build_bidflags(folder: Path, months: list[str])->pd.DataFrame:
-    out=[]
-    avail_cols=[f"BANDAVAIL{i}" for i in range(1,11)]
-    for m in months:
-        f=folder/f"bidperoffer_{m}.csv"
-        df=pd.read_csv(f, parse_dates=["INTERVAL_DATETIME"])
-        df=df[df["DUID"].isin(DUIDS)]
-        df=df[["INTERVAL_DATETIME","DUID","BIDTYPE"]+avail_cols]
-        df.rename(columns={"INTERVAL_DATETIME":"INTERVAL"}, inplace=True)
-        out.append(df)
-    bids=pd.concat(out, ignore_index=True)
-    bids.sort_values(["DUID","BIDTYPE","INTERVAL"], inplace=True)
-
-    # mark participants: appear at least once in month
-    participants = bids.groupby(["DUID","BIDTYPE"]).size().reset_index()
-    bids = bids.merge(participants[["DUID","BIDTYPE"]], on=["DUID","BIDTYPE"], how="left")
-
-    # diff across intervals
-    diff = bids.groupby(["DUID","BIDTYPE"])[avail_cols].diff().abs()
-    bids["Bid_change"] = diff.gt(0).any(axis=1).astype(int)
-    return bids[["INTERVAL","DUID","BIDTYPE","Bid_change"]]
-
 months = ["november2019","december2019",
           "january2020","february2020","march2020"]
-bidflags = build_bidflags(Path("price_bands"), months)
+bidflags = build_bidflags(Path("price_bands"), months, DUIDS)
 
 # align markets naming
 bidflags["Market"] = bidflags["BIDTYPE"].replace({"ENERGY":"ENERGY"})
@@ -112,13 +97,15 @@ panel = bidflags.merge(price, on="INTERVAL", how="left")
 
 # shift bid_change -2 intervals backward so it becomes τ+2
 panel.sort_values(["DUID","Market","INTERVAL"], inplace=True)
-panel["ATTN_t2"] = (panel.groupby(["DUID","Market"])["Bid_change"]
-                          .shift(-2))
+run_key = (panel["DUID"].cat.codes.to_numpy().astype(np.int64)
+           * len(panel["Market"].cat.categories)
+           + panel["Market"].cat.codes.to_numpy())
+panel["ATTN_t2"] = grouped_lead(panel["Bid_change"].to_numpy(), run_key, 2)
 panel = panel.dropna(subset=["ATTN_t2"])
 
 # attach capacity (use max observed MW in period)
-cap = load.groupby("DUID")["ENERGY"].max().reset_index(name="MAXCAP")
-panel = panel.merge(cap, on="DUID", how="left")
+cap = load.groupby("DUID", observed=True)["ENERGY"].max()
+panel["MAXCAP"] = panel["DUID"].map(cap).astype(float)
 panel["logCap"] = np.log(panel["MAXCAP"].replace(0,np.nan)).fillna(0)
 
 # attach Battery dummy
@@ -128,34 +115,28 @@ panel["Battery"] = panel["DUID"].isin(BATTERIES).astype(int)
 # 5.  BUILD ShareE (rolling 24h)  ------------------------------------
 # -------------------------------------------------------------------
 # revenue by interval
+# one join of MW on prices, then MW × $/MWh × 5/60 for all markets at once
 price_cols = {"ENERGY":"RRP", **{m:m+"RRP" for m in FCAS_MARKETS}}
-rev_frames=[]
-for m,label in price_cols.items():
-    sub = (load[["INTERVAL","DUID",m]]
-           .merge(price[["INTERVAL",label]], on="INTERVAL"))
-    sub["rev"] = sub[m]*sub[label]*5/60
-    sub = sub[["INTERVAL","DUID","rev"]].rename(columns={"rev":f"rev_{m}"})
-    rev_frames.append(sub)
-
-rev = rev_frames[0]
-for f in rev_frames[1:]:
-    rev = rev.merge(f, on=["INTERVAL","DUID"], how="outer")
-rev.fillna(0, inplace=True)
-
-rev["rev_E"]   = rev["rev_ENERGY"]
-rev["rev_F"]   = rev[[f"rev_{m}" for m in FCAS_MARKETS]].sum(axis=1)
+mw_px = (load[["INTERVAL","DUID",*price_cols]]
+         .merge(price[["INTERVAL",*price_cols.values()]], on="INTERVAL"))
+mkt_rev = (mw_px[list(price_cols)].to_numpy()
+           * mw_px[list(price_cols.values())].to_numpy()*5/60)
+mkt_rev[np.isnan(mkt_rev)] = 0
+
+rev = mw_px[["INTERVAL","DUID"]].copy()
+rev["rev_E"]   = mkt_rev[:, 0]
+rev["rev_F"]   = mkt_rev[:, 1:].sum(axis=1)
 
 # rolling 288-interval sums
 rev.sort_values(["DUID","INTERVAL"], inplace=True)
-rev["Roll_E"] = (rev.groupby("DUID")["rev_E"]
-                   .transform(lambda s: s.rolling(288, min_periods=1).sum()))
-rev["Roll_F"] = (rev.groupby("DUID")["rev_F"]
-                   .transform(lambda s: s.rolling(288, min_periods=1).sum()))
+duid_codes = rev["DUID"].cat.codes.to_numpy()
+rev["Roll_E"] = grouped_rolling_sum(rev["rev_E"].to_numpy(), duid_codes, 288)
+rev["Roll_F"] = grouped_rolling_sum(rev["rev_F"].to_numpy(), duid_codes, 288)
 rev["ShareE"] = rev["Roll_E"] / (rev["Roll_E"]+rev["Roll_F"])
 rev.loc[(rev["Roll_E"]+rev["Roll_F"])==0,"ShareE"] = 0.5
 
 # lag by 1 interval
-rev["ShareE_lag"] = rev.groupby("DUID")["ShareE"].shift(1)
+rev["ShareE_lag"] = rev.groupby("DUID", observed=True)["ShareE"].shift(1)
 panel = panel.merge(rev[["INTERVAL","DUID","ShareE_lag"]], on=["INTERVAL","DUID"], how="left")
 
 # -------------------------------------------------------------------
@@ -178,9 +159,9 @@ X_E = sm.add_constant(
       )
 y_E = energy["ATTN_t2"]
 
-model_E = Logit(y_E, X_E)
+model_E = sm.Logit(y_E, X_E)
 res_E = model_E.fit(disp=False,
                     cov_type="cluster",
-                    cov_kwds={"groups": energy["INTERVAL"]})
+                    cov_kwds={"groups": energy["INTERVAL"].astype("int64")})
 print("\n=== ENERGY-ONLY LOGIT (Menu-cost / RI) ===")
 print(res_E.summary())
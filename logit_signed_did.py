@@ -19,7 +19,8 @@ from pathlib import Path
 import pandas as pd
 import numpy as np
 import statsmodels.api as sm
-from statsmodels.discrete.discrete_model import Logit
+
+from pipeline import read_csv_cached, build_bidflags, grouped_rolling_sum, grouped_lead
 
 # -------------------------------------------------------------------
 # 0.  PARAMETERS & CONSTANTS
@@ -36,6 +37,9 @@ DUIDS = [
     "BARKIPS1", "AGLHAL", "OSB-AG"
 ]
 BATTERIES = {"HPRG1","HPRL1","DALNTH01","DALNTHL1","LBBG1","LBBL1"}
+# one shared dictionary for every DUID key; sorted so categorical
+# order matches the old string order
+DUID_TYPE = pd.CategoricalDtype(sorted(DUIDS))
 
 ENERGY_COL   = "RRP"
 FORECAST_PRE = "FC_"
@@ -54,18 +58,19 @@ MONTH_FILES = [
 # 1.  LOAD DISPATCHED MW  (energy + FCAS, SA only)
 # -------------------------------------------------------------------
 load_file = DATA_DIR/"dispatchload_unit_energy_fcas_201911_202003.csv"
-load = (pd.read_csv(load_file, parse_dates=["SETTLEMENTDATE"])
+load = (read_csv_cached(load_file, parse_dates=["SETTLEMENTDATE"])
           .rename(columns={"SETTLEMENTDATE":"INTERVAL"}))
 load = load[load["DUID"].isin(DUIDS)].copy()
+load["DUID"] = load["DUID"].astype(DUID_TYPE)
 load.sort_values(["DUID","INTERVAL"], inplace=True)
 
 # -------------------------------------------------------------------
 # 2.  LOAD PRICES  (actual + PD‑5 forecast)  -------------------------
 # -------------------------------------------------------------------
-price19 = pd.read_csv(Path("price_forecast")/"actual_forecast_2019.csv",
-                      parse_dates=["SETTLEMENTDATE"])
-price20 = pd.read_csv(Path("price_forecast")/"actual_forecast_2020.csv",
-                      parse_dates=["SETTLEMENTDATE"])
+price19 = read_csv_cached(Path("price_forecast")/"actual_forecast_2019.csv",
+                          parse_dates=["SETTLEMENTDATE"])
+price20 = read_csv_cached(Path("price_forecast")/"actual_forecast_2020.csv",
+                          parse_dates=["SETTLEMENTDATE"])
 price = pd.concat([price19, price20], ignore_index=True)
 price = price[price["REGIONID"]==REGION].rename(columns={"SETTLEMENTDATE":"INTERVAL"})
 
@@ -74,34 +79,15 @@ keep_cols = ["INTERVAL", ENERGY_COL, FORECAST_PRE+ENERGY_COL]
 price = price[keep_cols]
 
 # forecast errors (absolute and signed)
-price["Abs_FE_E"] = (price[ENERGY_COL] - price[FORECAST_PRE+ENERGY_COL]).abs()
-price["FE_E"]      = price[ENERGY_COL] - price[FORECAST_PRE+ENERGY_COL]
+fe = np.subtract(price[ENERGY_COL].to_numpy(),
+                 price[FORECAST_PRE+ENERGY_COL].to_numpy())
+price["Abs_FE_E"] = np.abs(fe)
+price["FE_E"]      = fe
 
 # -------------------------------------------------------------------
 # 3.  BUILD BID‑CHANGE FLAGS  ----------------------------------------
 # -------------------------------------------------------------------
-
-def build_bidflags(folder: Path, months: list[str]) -> pd.DataFrame:
-    avail_cols = [f"BANDAVAIL{i}" for i in range(1, 11)]
-    out = []
-    for m in months:
-        f = folder/f"bidperoffer_{m}.csv"
-        df = pd.read_csv(f, parse_dates=["INTERVAL_DATETIME"])
-        df = df[df["DUID"].isin(DUIDS)]
-        df = df[["INTERVAL_DATETIME", "DUID", "BIDTYPE"] + avail_cols]
-        df.rename(columns={"INTERVAL_DATETIME": "INTERVAL"}, inplace=True)
-        out.append(df)
-
-    bids = pd.concat(out, ignore_index=True)
-    bids.sort_values(["DUID", "BIDTYPE", "INTERVAL"], inplace=True)
-
-    # diff across intervals to flag any change
-    diff = bids.groupby(["DUID", "BIDTYPE"])[avail_cols].diff().abs()
-    bids["Bid_change"] = diff.gt(0).any(axis=1).astype(int)
-
-    return bids[["INTERVAL", "DUID", "BIDTYPE", "Bid_change"]]
-
-bidflags = build_bidflags(Path("price_bands"), MONTH_FILES)
+bidflags = build_bidflags(Path("price_bands"), MONTH_FILES, DUIDS)
 
 # align market naming (ENERGY only for this script)
 bidflags["Market"] = "ENERGY"
@@ -117,12 +103,14 @@ panel = bidflags.merge(price, on="INTERVAL", how="left")
 
 # shift bid_change −2 intervals so it reflects response at τ+2
 panel.sort_values(["DUID", "Market", "INTERVAL"], inplace=True)
-panel["ATTN_t2"] = (panel.groupby(["DUID", "Market"])["Bid_change"].shift(-2))
+# Market is the constant "ENERGY" here, so DUID alone keys the runs
+panel["ATTN_t2"] = grouped_lead(panel["Bid_change"].to_numpy(),
+                                panel["DUID"].cat.codes.to_numpy(), 2)
 panel.dropna(subset=["ATTN_t2"], inplace=True)
 
 # attach capacity (max observed MW in period)
-cap = load.groupby("DUID")["ENERGY"].max().reset_index(name="MAXCAP")
-panel = panel.merge(cap, on="DUID", how="left")
+cap = load.groupby("DUID", observed=True)["ENERGY"].max()
+panel["MAXCAP"] = panel["DUID"].map(cap).astype(float)
 panel["logCap"] = np.log(panel["MAXCAP"].replace(0, np.nan)).fillna(0)
 
 # battery dummy
@@ -141,10 +129,11 @@ rev["rev_E"] = rev["ENERGY"] * rev["P_E"] * 5/60
 
 # rolling 24 h (288 intervals) revenue share (energy vs. FCAS not needed here)
 rev.sort_values(["DUID", "INTERVAL"], inplace=True)
-rev["Roll_E"] = rev.groupby("DUID")["rev_E"].transform(lambda s: s.rolling(288, min_periods=1).sum())
+rev["Roll_E"] = grouped_rolling_sum(rev["rev_E"].to_numpy(),
+                                    rev["DUID"].cat.codes.to_numpy(), 288)
 # total revenue = Roll_E here (FCAS ignored in this minimal script)
 rev["ShareE"] = 1.0
-rev["ShareE_lag"] = rev.groupby("DUID")["ShareE"].shift(1)
+rev["ShareE_lag"] = rev.groupby("DUID", observed=True)["ShareE"].shift(1)
 
 panel = panel.merge(rev[["INTERVAL", "DUID", "ShareE_lag"]],
                     on=["INTERVAL", "DUID"], how="left")
@@ -199,10 +188,10 @@ X_E = sm.add_constant(
       )
 y_E = energy["ATTN_t2"].astype(int)
 
-logit_E = Logit(y_E, X_E)
+logit_E = sm.Logit(y_E, X_E)
 res_E = logit_E.fit(disp=False,
                     cov_type="cluster",
-                    cov_kwds={"groups": energy["INTERVAL"]})
+                    cov_kwds={"groups": energy["INTERVAL"].astype("int64")})
 
 print("\n=== ENERGY‑ONLY LOGIT: signed FE with battery interactions ===")
 print(res_E.summary())
@@ -17,7 +17,9 @@ import numpy as np
 import pandas as pd
 from pathlib import Path
 import statsmodels.api as sm
-from statsmodels.discrete.discrete_model import Logit
+
+from pipeline import (read_csv_cached, read_csv_months, bid_change,
+                      grouped_rolling_sum, grouped_lead)
 
 # -------------------------------------------------------------------
 # 0.  parameters & constants
@@ -40,65 +42,78 @@ MARKETS   = ["ENERGY",
              "RAISE6SEC","RAISE60SEC","RAISE5MIN","RAISEREG",
              "LOWER6SEC","LOWER60SEC","LOWER5MIN","LOWERREG"]
 
+# shared dictionaries for the DUID / Market keys; sorted so categorical
+# order (and the M_ dummy order) matches the old string order
+DUID_TYPE   = pd.CategoricalDtype(sorted(DUIDS))
+MARKET_TYPE = pd.CategoricalDtype(sorted(MARKETS))
+
 # -------------------------------------------------------------------
 # 1.  load dispatched-MW (energy + 8 FCAS) ---------------------------
 # -------------------------------------------------------------------
 load_path = Path("LoadData/dispatchload_unit_energy_fcas_201910-202003.csv")
-load = (pd.read_csv(load_path, parse_dates=["SETTLEMENTDATE"])
+load = (read_csv_cached(load_path, parse_dates=["SETTLEMENTDATE"])
           .rename(columns={"SETTLEMENTDATE":"INTERVAL"}))
 load = load[load["DUID"].isin(DUIDS)]
+load = load.astype({"DUID": DUID_TYPE})
 load.sort_values(["DUID","INTERVAL"], inplace=True)
 
 # -------------------------------------------------------------------
 # 2.  load prices & forecast → |FE| ----------------------------------
 # -------------------------------------------------------------------
 def prep_price(fname):
-    df = pd.read_csv(fname, parse_dates=["SETTLEMENTDATE"])
+    df = read_csv_cached(fname, parse_dates=["SETTLEMENTDATE"])
     return df[df["REGIONID"]==REGION]
 
-price = pd.concat([prep_price("price_forecast/actual_forecast_2019.csv"),
-                   prep_price("price_forecast/actual_forecast_2020.csv")],
-                  ignore_index=True)
-
-price_full = pd.concat([prep_price("price_forecast/actual_forecast_2019.csv"),
-                        prep_price("price_forecast/actual_forecast_2020.csv")],
-                       ignore_index=True)
-price_full.rename(columns={"SETTLEMENTDATE": "INTERVAL"}, inplace=True)
-
-price = price_full.copy()
-for m in MARKETS:
-    act = "RRP" if m == "ENERGY" else f"{m}RRP"
-    fc  = "FC_RRP" if m == "ENERGY" else f"FC_{m}RRP"
-    price[f"AbsFE_{m}"] = (price[act] - price[fc]).abs()+1
-    price[f"lnFE_{m}"]  = np.log(price[f"AbsFE_{m}"].clip(lower=1e-3))
-price = price[["INTERVAL"] + [f"lnFE_{m}" for m in MARKETS]]
+# loaded once: price_full keeps the actual prices for revenue (section 5),
+# price narrows to INTERVAL + lnFE_* below
+price_full = (pd.concat([prep_price("price_forecast/actual_forecast_2019.csv"),
+                         prep_price("price_forecast/actual_forecast_2020.csv")],
+                        ignore_index=True)
+                .rename(columns={"SETTLEMENTDATE": "INTERVAL"}))
+
+# ln(|FE|+1) for all markets in one matrix op; |FE|+1 >= 1, so the old
+# 1e-3 floor never binds and log1p gives the same value
+act_cols = ["RRP" if m == "ENERGY" else f"{m}RRP" for m in MARKETS]
+fc_cols  = ["FC_"+c for c in act_cols]
+ln_fe = np.subtract(price_full[act_cols].to_numpy(),
+                    price_full[fc_cols].to_numpy())
+np.abs(ln_fe, out=ln_fe)
+np.log1p(ln_fe, out=ln_fe)
+price = price_full[["INTERVAL"]].copy()
+price[[f"lnFE_{m}" for m in MARKETS]] = ln_fe
 
 # -------------------------------------------------------------------
 # 3.  bid-change flags (ENERGY + 8 FCAS) -----------------------------
 # -------------------------------------------------------------------
-def read_month(path):
-    df = pd.read_csv(path, parse_dates=["INTERVAL_DATETIME"])
-    return df[df["DUID"].isin(DUIDS)]
-
-frames=[]
-for m in ["november2019","december2019",
-          "january2020","february2020","march2020"]:
-    frames.append(read_month(Path(f"price_bands/bidperoffer_{m}.csv")))
-
-bids = pd.concat(frames, ignore_index=True)
 avail = [f"BANDAVAIL{i}" for i in range(1,11)]
-bids[avail] = bids[avail].apply(pd.to_numeric, errors="coerce")
+
+# one projected, DUID-filtered Arrow read across the five months
+bids = read_csv_months(
+    [Path(f"price_bands/bidperoffer_{m}.csv")
+     for m in ["november2019","december2019",
+               "january2020","february2020","march2020"]],
+    parse_dates=["INTERVAL_DATETIME"],
+    columns=["INTERVAL_DATETIME","DUID","BIDTYPE"] + avail,
+    duids=DUIDS)
+# float32 bands halve the bytes moved by the diff below
+bids[avail] = bids[avail].apply(pd.to_numeric, errors="coerce").astype(np.float32)
 bids.rename(columns={"INTERVAL_DATETIME":"INTERVAL","BIDTYPE":"Market"},
             inplace=True)
 bids = bids[bids["Market"].isin(MARKETS)]
+# categorical keys after the concat, so every month shares one dictionary
+bids = bids.astype({"DUID": DUID_TYPE, "Market": MARKET_TYPE})
 bids.sort_values(["DUID","Market","INTERVAL"], inplace=True)
 
-diff = bids.groupby(["DUID","Market"])[avail].diff()
-bids["Bid_change"] = diff.ne(0).any(axis=1).fillna(0).astype(int)
+# any band differs from the previous interval; as with groupby.diff().ne(0)
+# the first row of each DUID×Market and NaN differences count as changes
+duid = bids["DUID"].cat.codes.to_numpy()
+mkt  = bids["Market"].cat.codes.to_numpy()
+new_run = np.r_[True, (duid[1:] != duid[:-1]) | (mkt[1:] != mkt[:-1])]
+bids["Bid_change"] = bid_change(bids[avail].to_numpy(), new_run, nan_counts=True)
 
 # lag –2 → response at τ+2
-bids["ATTN_t2"] = (bids.groupby(["DUID","Market"])["Bid_change"]
-                        .shift(-2))
+run_key = duid.astype(np.int64)*len(MARKETS) + mkt
+bids["ATTN_t2"] = grouped_lead(bids["Bid_change"].to_numpy(), run_key, 2)
 bids = bids.dropna(subset=["ATTN_t2"])
 
 # Define start/end as Timestamps
@@ -116,9 +131,11 @@ bids = bids[(bids["INTERVAL"] >= START) & (bids["INTERVAL"] <= END)]
 # -------------------------------------------------------------------
 panel = bids.merge(price, on="INTERVAL", how="left")
 
-def pick_lnfe(row):
-    return row[f"lnFE_{row['Market']}"]
-panel["lnFE_use"] = panel.apply(pick_lnfe, axis=1)
+# each row's own-market ln|FE|, gathered by Market code in one pass
+mkt_codes = (pd.Categorical(panel["Market"], categories=MARKETS)
+               .codes.astype(np.intp))
+lnfe_mat  = np.ascontiguousarray(panel[[f"lnFE_{m}" for m in MARKETS]].to_numpy())
+panel["lnFE_use"] = np.take_along_axis(lnfe_mat, mkt_codes[:, None], axis=1).ravel()
 
 # -------------------------------------------------------------------
 # 4-bis.  trim the 1 % most extreme forecast-error observations
@@ -129,9 +146,9 @@ panel["lnFE_use"] = panel.apply(pick_lnfe, axis=1)
 # panel = panel[panel["lnFE_use"] <= p99]
 
 # OPTION B – market-specific cut-off  (safer if distributions differ)
-p99_by_mkt = (panel.groupby("Market")["lnFE_use"]
-                      .transform(lambda s: s.quantile(0.99)))
-panel = panel[panel["lnFE_use"] <= p99_by_mkt]
+p99_by_mkt = panel.groupby("Market", observed=True)["lnFE_use"].quantile(0.99)
+thr = panel["Market"].map(p99_by_mkt).astype(float).to_numpy()
+panel = panel[panel["lnFE_use"].to_numpy() <= thr]
 
 # -------------------------------------------------------------------
 # 5.  30-day revenue share per market -------------------------------
@@ -151,14 +168,15 @@ for m, col in act_cols.items():
     rev_parts.append(sub[["INTERVAL", "DUID", "Market", "Revenue"]])
 
 rev = pd.concat(rev_parts, ignore_index=True)
+rev["Market"] = rev["Market"].astype(MARKET_TYPE)
 rev.sort_values(["DUID","Market","INTERVAL"], inplace=True)
 
 # rolling 30-day (30*288=8640)
-roll = (rev.groupby(["DUID","Market"])["Revenue"]
-            .transform(lambda s: s.rolling(8640, min_periods=1).sum()))
-rev["RollRev"] = roll
+pair = (rev["DUID"].cat.codes.to_numpy().astype(np.int64)*len(MARKETS)
+        + rev["Market"].cat.codes.to_numpy())
+rev["RollRev"] = grouped_rolling_sum(rev["Revenue"].to_numpy(), pair, 8640)
 
-total = (rev.groupby(["DUID","INTERVAL"])["RollRev"]
+total = (rev.groupby(["DUID","INTERVAL"], observed=True)["RollRev"]
              .transform("sum"))
 rev["Share30"] = rev["RollRev"] / total
 rev["Share30"] = rev["Share30"].fillna(0)
@@ -170,69 +188,61 @@ panel = panel.merge(rev[["INTERVAL","DUID","Market","Share30"]],
 # 6.  capacity, dummies, interactions -------------------------------
 # -------------------------------------------------------------------
 
-cap = load.groupby("DUID")["ENERGY"].max().reset_index(name="MAXCAP")
-panel = panel.merge(cap, on="DUID", how="left")
-panel["logCap"] = np.where(panel["MAXCAP"]>0,
-                           np.log(panel["MAXCAP"]),0)
+cap = load.groupby("DUID", observed=True)["ENERGY"].max()
+maxcap = panel["DUID"].map(cap).astype(float).to_numpy()
+panel["logCap"] = np.where(maxcap>0, np.log(maxcap), 0)
 
 # hour FE
-panel["hour"] = panel["INTERVAL"].dt.hour
-hour_dum = pd.get_dummies(panel["hour"], prefix="h", drop_first=True, dtype="uint8")
+# rows of an identity over the hours present, first level dropped
+# (what get_dummies(drop_first=True) produced)
+h_levels, h_codes = np.unique(panel["INTERVAL"].dt.hour.to_numpy(),
+                              return_inverse=True)
+hour_eye = np.eye(len(h_levels), dtype=np.float32)[:, 1:]
 
 # market dummies (Energy baseline)
-m_dum = pd.get_dummies(panel["Market"], prefix="M", drop_first=True, dtype="uint8")
-panel = pd.concat([panel, m_dum], axis=1)
-
-# interactions
-for col in m_dum.columns:                      # M_RAISE6SEC …
-    panel[f"{col}:lnFE"]   = (panel[col]*panel["lnFE_use"]).astype("float32")
-    panel[f"{col}:Share"]  = (panel[col]*panel["Share30"]).astype("float32")
-    panel[f"{col}:lnFE:Share"] = (panel[col]*panel["lnFE_use"]*panel["Share30"]).astype("float32")
-
-panel["lnFE:Share"] = panel["lnFE_use"]*panel["Share30"]
-
-# list every continuous column you want in 32-bit floats
-num_cols = ["lnFE_use", "Share30", "lnFE:Share", "logCap"]
-panel[num_cols] = panel[num_cols].astype("float32")
-
-
-# design matrix
-# X = sm.add_constant(
-#         pd.concat([panel[["lnFE_use","Share30","lnFE:Share","logCap"]],
-#                    panel.filter(like="M_"),
-#                    panel.filter(like=":lnFE"),
-#                    panel.filter(like=":Share"),
-#                    panel.filter(like=":lnFE:Share"),
-#                    hour_dum], axis=1)
-#     )
-X_parts = [
-    panel[["lnFE_use", "Share30", "lnFE:Share", "logCap"]],
-    panel.filter(like="M_"),
-    panel.filter(like=":lnFE"),
-    panel.filter(like=":Share"),
-    panel.filter(like=":lnFE:Share"),
-    hour_dum
-]
-# X_parts = [
-#     panel[["lnFE_use", "Share30", "lnFE:Share", "logCap"]]
-# ]
-X = pd.concat(X_parts, axis=1, copy=False)          # no deep copy
-X.insert(0, "const", 1.0, allow_duplicates=False)   # manual intercept
-X = X.astype("float32", copy=False)                 # keep it light
-y = panel["ATTN_t2"]
-
-# drop any residual NaNs / inf
-mask = X.replace([np.inf,-np.inf], np.nan).dropna().index
-X, y = X.loc[mask], y.loc[mask]
-groups = panel.loc[mask,"INTERVAL"]
-# %%
-# keep only the first occurrence of each column name
-X = X.loc[:, ~X.columns.duplicated()]
-
+m_dum = pd.get_dummies(panel["Market"].cat.remove_unused_categories(),
+                       prefix="M", drop_first=True, dtype="uint8")
+
+# drop rows with NaN / inf in any continuous regressor
+ok = np.isfinite(panel[["lnFE_use", "Share30", "logCap"]].to_numpy()).all(axis=1)
+panel, m_dum, h_codes = panel[ok], m_dum[ok], h_codes[ok]
+
+# design matrix: one Fortran-ordered float32 block filled in place
+#   const | lnFE_use Share30 lnFE:Share logCap | M_* |
+#   M_*:lnFE M_*:Share M_*:lnFE:Share (per market) | h_*
+lnfe       = panel["lnFE_use"].to_numpy()
+share      = panel["Share30"].to_numpy()
+lnfe_share = lnfe*share
+mkt        = m_dum.to_numpy()
+k          = mkt.shape[1]
+
+X_arr = np.empty((len(panel), 5 + 4*k + hour_eye.shape[1]),
+                 dtype=np.float32, order="F")
+X_arr[:, 0] = 1.0
+X_arr[:, 1] = lnfe
+X_arr[:, 2] = share
+X_arr[:, 3] = lnfe_share
+X_arr[:, 4] = panel["logCap"].to_numpy()
+X_arr[:, 5:5+k] = mkt
+col = 5 + k
+for j in range(k):                             # M_RAISE6SEC …
+    for v in (lnfe, share, lnfe_share):
+        np.multiply(mkt[:, j], v, out=X_arr[:, col])
+        col += 1
+X_arr[:, col:] = hour_eye[h_codes]
+
+x_names = (["const", "lnFE_use", "Share30", "lnFE:Share", "logCap"]
+           + list(m_dum.columns)
+           + [f"{c}:{s}" for c in m_dum.columns
+                         for s in ("lnFE", "Share", "lnFE:Share")]
+           + [f"h_{h}" for h in h_levels[1:]])
+X = pd.DataFrame(X_arr, columns=x_names, copy=False)
+y = panel["ATTN_t2"].reset_index(drop=True)
+groups = panel["INTERVAL"].astype("int64").to_numpy()   # int64 keys factorize fastest
 
 stacked = sm.Logit(y, X).fit(cov_type="cluster",
-                         cov_kwds={"groups": groups},
-                         disp=False)
+                             cov_kwds={"groups": groups},
+                             disp=False)
 
 
 
@@ -13,11 +13,16 @@ Folder layout (relative to this file)
       bidperoffer_<month>.csv  (Nov‑2019 … Mar‑2020)
 """
 
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pandas as pd
 from pathlib import Path
 import statsmodels.api as sm
-from statsmodels.discrete.discrete_model import Logit
+
+from pipeline import (read_csv_cached, read_csv_months, rolling_std,
+                      bid_change, grouped_lead, grouped_rolling_sum)
 
 # ------------------------------------------------------------------
 # 0.  parameters & constants
@@ -38,13 +43,19 @@ MARKETS = ["ENERGY",
            "RAISE6SEC","RAISE60SEC","RAISE5MIN","RAISEREG",
            "LOWER6SEC","LOWER60SEC","LOWER5MIN","LOWERREG"]
 
+# string keys become categoricals straight after loading; sorted categories
+# keep every sort_values in the same order as on the raw strings
+DUID_TYPE   = pd.CategoricalDtype(sorted(DUIDS))
+MARKET_TYPE = pd.CategoricalDtype(sorted(MARKETS))
+
 # ------------------------------------------------------------------
 # 1.  dispatched MW (energy + FCAS)    ------------------------------
 # ------------------------------------------------------------------
 load_path = Path("LoadData/dispatchload_unit_energy_fcas_201910-202003.csv")
-load = (pd.read_csv(load_path, parse_dates=["SETTLEMENTDATE"])\
+load = (read_csv_cached(load_path, parse_dates=["SETTLEMENTDATE"])
           .rename(columns={"SETTLEMENTDATE":"INTERVAL"}))
-load = load[load["DUID"].isin(DUIDS)]
+load = load.loc[load["DUID"].isin(DUIDS), ["INTERVAL","DUID"] + MARKETS]
+load = load.astype({"DUID": DUID_TYPE})
 load.sort_values(["DUID","INTERVAL"], inplace=True)
 
 # ------------------------------------------------------------------
@@ -52,7 +63,7 @@ load.sort_values(["DUID","INTERVAL"], inplace=True)
 # ------------------------------------------------------------------
 
 def prep_price(fname: str):
-    df = pd.read_csv(fname, parse_dates=["SETTLEMENTDATE"])
+    df = read_csv_cached(fname, parse_dates=["SETTLEMENTDATE"])
     return df[df["REGIONID"] == REGION]
 
 price_full = pd.concat(
@@ -62,17 +73,29 @@ price_full = pd.concat(
 price_full.rename(columns={"SETTLEMENTDATE": "INTERVAL"}, inplace=True)
 price_full.sort_values("INTERVAL", inplace=True)
 
-# realised volatility (24‑hour rolling std of price *levels*)
-for m in MARKETS:
-    col = "RRP" if m == "ENERGY" else f"{m}RRP"
-    price_full[f"sigma_{m}"] = (price_full[col]
-         .rolling(VOL_WIN, min_periods=VOL_WIN//4).std())
-
-# absolute FE and ln|FE|  (needed later)
-for m in MARKETS:
-    act = "RRP" if m == "ENERGY" else f"{m}RRP"
-    fc  = "FC_RRP" if m == "ENERGY" else f"FC_{m}RRP"
-    price_full[f"lnFE_{m}"] = np.log((price_full[act]-price_full[fc]).abs()+1e-3)
+act_cols = ["RRP" if m == "ENERGY" else f"{m}RRP" for m in MARKETS]
+fc_cols  = ["FC_"+c for c in act_cols]
+act_mat  = price_full[act_cols].to_numpy()
+
+# realised volatility (24‑hour rolling std of price *levels*): the markets
+# are independent, so blocks of columns go to worker threads (NumPy drops
+# the GIL in the prefix sums) while this thread does ln|FE| below; with a
+# single core this is one block, i.e. the plain (N, 9) pass
+col_blocks = np.array_split(np.arange(len(MARKETS)),
+                            min(len(MARKETS), os.cpu_count() or 1))
+with ThreadPoolExecutor(max_workers=len(col_blocks)) as ex:
+    sigma_parts = ex.map(lambda b: rolling_std(act_mat[:, b], VOL_WIN, VOL_WIN//4),
+                         col_blocks)
+
+    # absolute FE and ln|FE|  (needed later): sub, abs, +1e-3 and log over
+    # the (N, 9) matrix in place, one temporary in all
+    ln_fe = np.subtract(act_mat, price_full[fc_cols].to_numpy())
+    np.abs(ln_fe, out=ln_fe)
+    np.add(ln_fe, 1e-3, out=ln_fe)
+    np.log(ln_fe, out=ln_fe)
+
+    price_full[[f"sigma_{m}" for m in MARKETS]] = np.hstack(list(sigma_parts))
+price_full[[f"lnFE_{m}" for m in MARKETS]] = ln_fe
 
 price = price_full[["INTERVAL"] + [f"lnFE_{m}" for m in MARKETS] +
                    [f"sigma_{m}" for m in MARKETS]].copy()
@@ -85,16 +108,9 @@ price = price_full[["INTERVAL"] + [f"lnFE_{m}" for m in MARKETS] +
 mask = (price_full["INTERVAL"] >= START) & (price_full["INTERVAL"] <= END)
 price_in_win = price_full.loc[mask].copy()
 
-stats = []
-for m in MARKETS:
-    col = "RRP" if m == "ENERGY" else f"{m}RRP"
-    s = price_in_win[col]
-    stats.append(
-        s.agg(["mean", "std", "min", "median", "max"]).rename(m)
-    )
-
-price_stats = pd.DataFrame(stats)
-price_stats.index.name = "Market"
+# one reduction over the nine price columns, one row per market
+price_stats = price_in_win[act_cols].agg(["mean", "std", "min", "median", "max"]).T
+price_stats.index = pd.Index(MARKETS, name="Market")
 print("\n=== price summary over sample ===")
 print(price_stats.round(2))
 price_stats.to_csv("price_summary_markets.csv")
@@ -105,26 +121,30 @@ print("Saved to 'price_summary_markets.csv'")
 # 3.  bid‑change flags  ---------------------------------------------
 # ------------------------------------------------------------------
 
-def read_month(path: Path):
-    df = pd.read_csv(path, parse_dates=["INTERVAL_DATETIME"])
-    return df[df["DUID"].isin(DUIDS)]
-
-frames = []
-for m in ["november2019","december2019",
-          "january2020","february2020","march2020"]:
-    frames.append(read_month(Path(f"price_bands/bidperoffer_{m}.csv")))
-
-bids = pd.concat(frames, ignore_index=True)
 avail = [f"BANDAVAIL{i}" for i in range(1, 11)]
+
+# one projected, DUID-filtered Arrow read across the five months
+bids = read_csv_months(
+    [Path(f"price_bands/bidperoffer_{m}.csv")
+     for m in ["november2019","december2019",
+               "january2020","february2020","march2020"]],
+    parse_dates=["INTERVAL_DATETIME"],
+    columns=["INTERVAL_DATETIME","DUID","BIDTYPE"] + avail,
+    duids=DUIDS)
 bids[avail] = bids[avail].apply(pd.to_numeric, errors="coerce")
 bids.rename(columns={"INTERVAL_DATETIME":"INTERVAL","BIDTYPE":"Market"}, inplace=True)
 bids = bids[bids["Market"].isin(MARKETS)]
+bids = bids.astype({"DUID": DUID_TYPE, "Market": MARKET_TYPE})
 bids.sort_values(["DUID","Market","INTERVAL"], inplace=True)
 
-bids["Bid_change"] = (bids.groupby(["DUID","Market"])[avail]
-                           .diff().ne(0).any(axis=1).fillna(0).astype(int))
+# any band differs from the previous interval; as with groupby.diff().ne(0)
+# the first row of each DUID×Market and NaN differences count as changes
+duid = bids["DUID"].cat.codes.to_numpy()
+mkt  = bids["Market"].cat.codes.to_numpy()
+new_run = np.r_[True, (duid[1:] != duid[:-1]) | (mkt[1:] != mkt[:-1])]
+bids["Bid_change"] = bid_change(bids[avail].to_numpy(), new_run, nan_counts=True)
 # shift −2 for response at t+2
-bids["ATTN_t2"] = bids.groupby(["DUID","Market"])["Bid_change"].shift(-2)
+bids["ATTN_t2"] = grouped_lead(bids["Bid_change"].to_numpy(), np.cumsum(new_run), 2)
 bids.dropna(subset=["ATTN_t2"], inplace=True)
 
 # crop to analysis window
@@ -135,89 +155,164 @@ load, price, bids = map(mask_intvl, (load, price, bids))
 # ------------------------------------------------------------------
 # 4.  merge ln|FE| & volatility  ------------------------------------
 # ------------------------------------------------------------------
-panel = bids.merge(price, on="INTERVAL", how="left")
-
-panel["lnFE_use"] = panel.apply(lambda r: r[f"lnFE_{r['Market']}"], axis=1)
-panel["sigma"]     = panel.apply(lambda r: r[f"sigma_{r['Market']}"] , axis=1)
+# price is sorted with one row per INTERVAL, so the left join is a binary
+# search on the int64 timestamps; each row's own-market ln|FE| and σ are
+# then gathered by (price row, Market code) without widening the panel
+lnfe_cols  = [f"lnFE_{m}" for m in MARKET_TYPE.categories]
+sigma_cols = [f"sigma_{m}" for m in MARKET_TYPE.categories]
+p_i8 = price["INTERVAL"].to_numpy("datetime64[ns]").view("i8")
+if len(p_i8) == 0:
+    raise ValueError(f"no {REGION} prices between {START} and {END}; "
+                     "check the price_forecast/ files")
+if not (np.diff(p_i8) > 0).all():
+    # the merge would duplicate bid rows on a repeated INTERVAL
+    raise ValueError(f"{REGION} price INTERVALs are not strictly increasing; "
+                     "check the price_forecast/ files for overlapping rows")
+b_i8 = bids["INTERVAL"].to_numpy("datetime64[ns]").view("i8")
+idx  = np.searchsorted(p_i8, b_i8).clip(max=len(p_i8)-1)
+miss = p_i8[idx] != b_i8                 # no price row: NaN, as the merge gave
+mkt_codes = bids["Market"].cat.codes.to_numpy()
+
+panel = bids.reset_index(drop=True)
+for name, cols in (("lnFE_use", lnfe_cols), ("sigma", sigma_cols)):
+    vals = price[cols].to_numpy()[idx, mkt_codes]
+    vals[miss] = np.nan
+    panel[name] = vals
 panel["lnSigma"]   = np.log(panel["sigma"].clip(lower=1e-3))
 
 # trim top‑1 % extreme ln|FE| by market
-p99 = panel.groupby("Market")["lnFE_use"].transform(lambda s: s.quantile(0.99))
-panel = panel[panel["lnFE_use"] <= p99]
+p99_by_mkt = panel.groupby("Market", observed=True)["lnFE_use"].quantile(0.99)
+thr = panel["Market"].map(p99_by_mkt).astype(float).to_numpy()
+panel = panel[panel["lnFE_use"].to_numpy() <= thr]
 
 # ------------------------------------------------------------------
 # 5.  30‑day revenue share per market  ------------------------------
 # ------------------------------------------------------------------
-act_cols = {"ENERGY":"RRP", **{m:f"{m}RRP" for m in MARKETS if m!="ENERGY"}}
-rev_parts = []
-for m, col in act_cols.items():
-    sub = load[["INTERVAL","DUID", m]].merge(price_full[["INTERVAL", col]], on="INTERVAL")
-    sub["Revenue"], sub["Market"] = sub[m]*sub[col]*5/60, m
-    rev_parts.append(sub[["INTERVAL","DUID","Market","Revenue"]])
-rev = pd.concat(rev_parts, ignore_index=True)
-rev.sort_values(["DUID","Market","INTERVAL"], inplace=True)
-rev["RollRev"] = rev.groupby(["DUID","Market"])['Revenue'].transform(lambda s: s.rolling(8640, min_periods=1).sum())
-rev_total = rev.groupby(["DUID","INTERVAL"])['RollRev'].transform('sum')
-rev['Share30'] = (rev['RollRev']/rev_total).fillna(0)
-
-panel = panel.merge(rev[["INTERVAL","DUID","Market","Share30"]], on=["INTERVAL","DUID","Market"], how="left")
+# revenue kept wide: one row per DUID×INTERVAL, one column per market
+# (MARKET_TYPE order, so Market codes index the columns)
+mkts  = list(MARKET_TYPE.categories)
+px    = ["RRP" if m == "ENERGY" else f"{m}RRP" for m in mkts]
+mw_px = (load[["INTERVAL","DUID", *mkts]]
+           .merge(price_full[["INTERVAL", *px]], on="INTERVAL")
+           .sort_values(["DUID","INTERVAL"], kind="stable"))
+R = np.multiply(mw_px[mkts].to_numpy(), mw_px[px].to_numpy(), order="F")
+R *= 5/60
+
+# rolling 30-day (30*288=8640) sum down each DUID's rows, every market in
+# one pass: the column-major ravel lays the DUID×Market runs end to end
+duid    = mw_px["DUID"].cat.codes.to_numpy()
+new_run = np.r_[True, duid[1:] != duid[:-1]]
+run_key = np.cumsum(new_run)
+roll = grouped_rolling_sum(
+           R.ravel(order="F"),
+           (np.arange(len(mkts))[None, :]*(run_key[-1] + 1)
+            + run_key[:, None]).ravel(order="F"),
+           8640).reshape(R.shape, order="F")
+with np.errstate(divide="ignore", invalid="ignore"):
+    share = roll / np.nansum(roll, axis=1, keepdims=True)
+share[np.isnan(share)] = 0
+
+# each panel row's own-market share, looked up by (DUID, INTERVAL); rows
+# with no load entry (-1) stay NaN, as the merge left them
+mw_key = pd.MultiIndex.from_arrays([mw_px["DUID"], mw_px["INTERVAL"]])
+if not mw_key.is_unique:
+    raise ValueError("load has repeated (DUID, INTERVAL) rows; "
+                     "the revenue share lookup needs one row per pair")
+row = mw_key.get_indexer(
+          pd.MultiIndex.from_arrays([panel["DUID"], panel["INTERVAL"]]))
+hit = row >= 0
+panel = panel.reset_index(drop=True)
+share30 = np.full(len(panel), np.nan)
+share30[hit] = share[row[hit], panel["Market"].cat.codes.to_numpy()[hit]]
+panel["Share30"] = share30
 
 # ------------------------------------------------------------------
 # 6.  capacity, dummies, interactions  ------------------------------
 # ------------------------------------------------------------------
-cap = load.groupby("DUID")["ENERGY"].max().reset_index(name="MAXCAP")
-panel = panel.merge(cap, on="DUID", how="left")
-panel["logCap"] = np.where(panel["MAXCAP"]>0, np.log(panel["MAXCAP"]), 0)
-
-# hour FE
-panel["hour"] = panel["INTERVAL"].dt.hour
-hour_dum = pd.get_dummies(panel["hour"], prefix="h", drop_first=True, dtype="uint8")
-
-# market dummies (ENERGY baseline)
-m_dum = pd.get_dummies(panel["Market"], prefix="M", drop_first=True, dtype="uint8")
-panel = pd.concat([panel, m_dum], axis=1)
-
-# base continuous interactions
-panel["lnFE:Share"]      = panel["lnFE_use"] * panel["Share30"]
-panel["lnSigma:Share"]   = panel["lnSigma"]   * panel["Share30"]
-panel["lnSigma:lnFE"]    = panel["lnSigma"]   * panel["lnFE_use"]
-
-# market‑specific interactions
-for col in m_dum.columns:
-    panel[f"{col}:lnSigma"]        = panel[col] * panel["lnSigma"]
-    panel[f"{col}:lnSigma:Share"]  = panel[col] * panel["lnSigma:Share"]
-    panel[f"{col}:lnFE"]           = panel[col] * panel["lnFE_use"]
-    panel[f"{col}:Share"]          = panel[col] * panel["Share30"]
-    panel[f"{col}:lnFE:Share"]     = panel[col] * panel["lnFE:Share"]
-
-# float32 cast
-num_cols = ["lnFE_use","Share30","lnFE:Share","lnSigma","lnSigma:Share","lnSigma:lnFE","logCap"]
-panel[num_cols] = panel[num_cols].astype("float32")
+# load is sorted by DUID, so each unit's max ENERGY is one fmax.reduceat
+# segment (fmax skips NaN, as groupby max does); units with no load rows
+# keep NaN capacity and so logCap 0
+duid   = load["DUID"].cat.codes.to_numpy()
+starts = np.flatnonzero(np.r_[True, duid[1:] != duid[:-1]])
+maxcap = np.full(len(DUID_TYPE.categories), np.nan)
+maxcap[duid[starts]] = np.fmax.reduceat(load["ENERGY"].to_numpy(dtype=float), starts)
+log_cap = np.zeros_like(maxcap)
+np.log(maxcap, out=log_cap, where=maxcap > 0)
+panel["logCap"] = log_cap[panel["DUID"].cat.codes.to_numpy()]
+
+# hour FE and market dummies (ENERGY baseline): rows of identity matrices
+# over the levels present, first level dropped as get_dummies did
+h_levels, h_codes = np.unique(panel["INTERVAL"].dt.hour.to_numpy(),
+                              return_inverse=True)
+m_used, m_codes = np.unique(panel["Market"].cat.codes.to_numpy(),
+                            return_inverse=True)
+m_levels = MARKET_TYPE.categories[m_used]
+hour_eye = np.eye(len(h_levels), dtype=np.float32)[:, 1:]
+m_eye    = np.eye(len(m_levels), dtype=np.float32)[:, 1:]
+m_names  = [f"M_{m}" for m in m_levels[1:]]
+
+# drop rows with NaN / inf in any continuous regressor (the dummies and
+# their products are finite wherever these are) or in the outcome; the
+# mask is and-ed column by column, with no (N, k) copy of the inputs
+ok = np.logical_and.reduce(
+         [np.isfinite(panel[c].to_numpy())
+          for c in ("lnFE_use", "Share30", "lnSigma", "logCap", "ATTN_t2")])
+panel, h_codes, m_codes = panel[ok], h_codes[ok], m_codes[ok]
+
+# base continuous regressors and interactions
+lnfe, share, lnsig = (panel[c].to_numpy()
+                      for c in ("lnFE_use", "Share30", "lnSigma"))
+base = {"lnFE_use":      lnfe,
+        "Share30":       share,
+        "lnFE:Share":    lnfe*share,
+        "lnSigma":       lnsig,
+        "lnSigma:Share": lnsig*share,
+        "lnSigma:lnFE":  lnsig*lnfe,
+        "logCap":        panel["logCap"].to_numpy()}
+
+# market‑specific interactions: suffix -> base regressor
+INTER = {"lnSigma":       "lnSigma",
+         "lnSigma:Share": "lnSigma:Share",
+         "lnFE":          "lnFE_use",
+         "Share":         "Share30",
+         "lnFE:Share":    "lnFE:Share"}
 
 # ------------------------------------------------------------------
 # 7.  build design matrix & run logit  -------------------------------
 # ------------------------------------------------------------------
-X_parts = [
-    panel[["lnFE_use","Share30","lnFE:Share",
-           "lnSigma","lnSigma:Share","lnSigma:lnFE","logCap"]],
-    panel.filter(like="M_"),
-    panel.filter(like=":lnFE"),
-    panel.filter(like=":Share"),
-    panel.filter(like=":lnSigma"),
-    hour_dum,
-]
-X = pd.concat(X_parts, axis=1, copy=False)
-X.insert(0, "const", 1.0, allow_duplicates=False)
-X = X.loc[:, ~X.columns.duplicated()].astype("float32", copy=False)
-
-y = panel["ATTN_t2"].astype(int)
-
-# drop rows with NaNs / infs in X or y
-mask = X.replace([np.inf,-np.inf], np.nan).dropna().index
-X, y = X.loc[mask], y.loc[mask]
+# one Fortran-ordered float32 block filled in place
+#   const | base | M_* | M_*:{INTER} (per market) | h_*
+mkt = m_eye[m_codes]
+k   = mkt.shape[1]
+X_arr = np.empty((len(panel), 1 + len(base) + k*(1 + len(INTER))
+                              + hour_eye.shape[1]),
+                 dtype=np.float32, order="F")
+X_arr[:, 0] = 1.0
+for col, v in enumerate(base.values(), start=1):
+    X_arr[:, col] = v
+col = 1 + len(base)
+X_arr[:, col:col+k] = mkt
+col += k
+# all k×5 interactions in one broadcast product: the Fortran-order reshape
+# of the column slice is a view whose [n, b, j] is column col + j*5 + b
+B = np.column_stack([base[b] for b in INTER.values()])
+n_int = k*len(INTER)
+np.multiply(B[:, :, None], mkt[:, None, :],
+            out=X_arr[:, col:col+n_int].reshape(len(panel), len(INTER), k,
+                                                 order="F"))
+col += n_int
+X_arr[:, col:] = hour_eye[h_codes]
+
+x_names = (["const", *base] + m_names
+           + [f"{c}:{s}" for c in m_names for s in INTER]
+           + [f"h_{h}" for h in h_levels[1:]])
+X = pd.DataFrame(X_arr, columns=x_names, copy=False)
+y = panel["ATTN_t2"].astype(int).reset_index(drop=True)
 
 # cluster by interval
-stacked = Logit(y, X).fit(cov_type="cluster", cov_kwds={"groups": panel.loc[mask, "INTERVAL"]}, disp=False)
+groups = panel["INTERVAL"].astype("int64").to_numpy()
+stacked = sm.Logit(y, X).fit(cov_type="cluster", cov_kwds={"groups": groups},
+                             disp=False)
 
 print(stacked.summary())
 
@@ -0,0 +1,264 @@
+"""
+pipeline.py
+shared loaders and NumPy helpers for the logit scripts
+---------------------------------------------------------
+The logit_*.py scripts import from here. The load and price frames and
+the bid-change flags are memoised in-process, so run_all.py reads them
+once for all of the models; the raw bid months are scanned without
+memoising and freed as soon as each script has used them.
+"""
+
+import functools
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pv
+import pyarrow.dataset as ds
+import pyarrow.feather as pf
+
+# Under Copy-on-Write (always on from pandas 3) a shallow copy already
+# protects the memoised frames from callers' edits; older pandas needs a
+# deep one
+_COW = int(pd.__version__.split(".")[0]) >= 3
+
+def _own(df):
+    # the caller's copy of a memoised frame
+    return df.copy(deep=not _COW)
+
+# -------------------------------------------------------------------
+# CSV reader with a typed Arrow copy
+# -------------------------------------------------------------------
+def read_csv_cached(path, parse_dates):
+    """pd.read_csv backed by <name>.cache.arrow next to the CSV.
+
+    The copy is an uncompressed Arrow IPC (Feather v2) file, rebuilt
+    whenever the CSV is newer, so repeat runs skip tokenising and date
+    parsing and only convert the stored columns to pandas. Within one
+    process the frame is memoised and each caller gets its own copy.
+    """
+    cache = _arrow_copy(path, parse_dates)
+    return _own(_read_arrow(str(cache), cache.stat().st_mtime_ns))
+
+def read_csv_months(paths, parse_dates, columns, duids):
+    """Selected columns of several CSVs, DUID rows only, as one frame.
+
+    Scans the Arrow copies with column projection and the DUID filter
+    applied inside Arrow, so the months are never converted to pandas
+    in full. Not memoised.
+    """
+    tables = [ds.dataset(_arrow_copy(p, parse_dates), format="ipc")
+                .to_table(columns=columns,
+                          filter=ds.field("DUID").isin(list(duids)))
+              for p in paths]
+    # a band column can be int64 in one month and double in another; the
+    # concat only references the months' buffers, and self_destruct frees
+    # each Arrow column as soon as it has been converted
+    table = pa.concat_tables(tables, promote_options="permissive")
+    del tables
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+def _arrow_copy(path, parse_dates):
+    # (re)build <name>.cache.arrow when missing or older than the CSV
+    path  = Path(path)
+    cache = path.with_suffix(".cache.arrow")
+    if path.exists() and (not cache.exists()
+                          or cache.stat().st_mtime < path.stat().st_mtime):
+        # multithreaded Arrow parse, written straight to Arrow IPC;
+        # uncompressed so that reads need no decompression
+        opts = pv.ConvertOptions(
+            column_types={c: pa.timestamp("ns") for c in parse_dates},
+            timestamp_parsers=[pv.ISO8601, "%Y/%m/%d %H:%M:%S",
+                               "%m/%d/%Y %H:%M"])
+        try:
+            table = pv.read_csv(path, convert_options=opts)
+        except pa.ArrowInvalid:
+            # a date layout Arrow does not know: let pandas infer it
+            df = pd.read_csv(path, parse_dates=list(parse_dates))
+            df = df.astype({c: "datetime64[ns]" for c in parse_dates})
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        pf.write_feather(table, cache, compression="uncompressed")
+    return cache
+
+@functools.lru_cache(maxsize=4)
+def _read_arrow(path, mtime_ns):
+    # keyed on the file's mtime, so a rebuilt cache is read afresh; the
+    # scripts share three files (load, 2019 and 2020 prices), and the
+    # small bound keeps anything else from being pinned for good
+    return pf.read_table(path).to_pandas()
+
+
+# -------------------------------------------------------------------
+# grouped trailing rolling sum
+# -------------------------------------------------------------------
+def grouped_rolling_sum(values, keys, window):
+    """Trailing `window`-row sum within runs of equal `keys`.
+
+    Rows must already be sorted by key then time. Same result as
+    groupby(keys).rolling(window, min_periods=1).sum(): NaNs are skipped,
+    a window with no valid value is NaN, and an all-zero window is
+    exactly 0. Runs in O(N) from prefix sums: the sum over rows lo..i is
+    csum[i+1] - csum[lo], with csum restarted at every run.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    keys   = np.asarray(keys)
+    n      = len(values)
+    idx    = np.arange(n)
+
+    valid = ~np.isnan(values)
+    vals  = np.where(valid, values, 0.0)
+    ccnt  = np.concatenate(([0], np.cumsum(valid)))
+    cnz   = np.concatenate(([0], np.cumsum(vals != 0)))
+
+    # first row of each row's run, then the window's first row
+    run_start = np.zeros(n, dtype=np.int64)
+    csum = np.zeros(n + 1)
+    if n:
+        new_run = np.r_[True, keys[1:] != keys[:-1]]
+        run_start = np.maximum.accumulate(np.where(new_run, idx, 0))
+        bounds = np.r_[np.flatnonzero(new_run), n]
+        for s, e in zip(bounds[:-1], bounds[1:]):
+            # per-run prefix sums, so rounding never carries across runs
+            csum[s+1:e+1] = np.cumsum(vals[s:e])
+    lo = np.maximum(idx - window + 1, run_start)
+    hi = idx + 1
+
+    # csum[lo] is the previous run's total when the window starts a run
+    out = csum[hi] - np.where(lo == run_start, 0.0, csum[lo])
+    out[cnz[hi] == cnz[lo]] = 0.0            # no rounding residue on zeros
+    out[ccnt[hi] == ccnt[lo]] = np.nan       # nothing valid in the window
+    return out
+
+# -------------------------------------------------------------------
+# rolling standard deviation down the columns of a matrix
+# -------------------------------------------------------------------
+def rolling_std(X, window, min_periods):
+    """Trailing rolling std (ddof=1) down each column of a 2-D array.
+
+    Same windows as DataFrame.rolling(window, min_periods).std(): NaNs are
+    skipped, fewer than `min_periods` valid rows give NaN, and a window of
+    identical values is exactly 0. Rows are cut into blocks of `window`,
+    so a window is a suffix of one block plus a prefix of the next.
+    Welford's running (count, mean, M2) over every block prefix and
+    suffix are merged pairwise (Chan et al.), which avoids both the
+    cancellation of E[x^2] - E[x]^2 and the rounding residue one price
+    spike leaves in every later window of pandas' add/remove update.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    n, k = X.shape
+    n_blk = -(-n // window)
+    blk = np.full((n_blk*window, k), np.nan)
+    blk[:n] = X
+    blk = blk.reshape(n_blk, window, k)
+
+    def welford(rows):
+        # running (count, mean, M2) of each block over `rows`, in order,
+        # stepping all blocks at once; NaNs leave the state unchanged
+        stats = np.zeros((3, n_blk, window, k))
+        c, mu, m2 = np.zeros((3, n_blk, k))
+        for t in rows:
+            x  = blk[:, t]
+            ok = ~np.isnan(x)
+            c  = c + ok
+            d  = np.where(ok, x - mu, 0.0)
+            mu = mu + d / np.maximum(c, 1)
+            m2 = m2 + np.where(ok, d * (x - mu), 0.0)
+            stats[:, :, t] = c, mu, m2
+        return stats
+
+    n_b, mu_b, m2_b = welford(range(window))             # rows 0..t
+    suffix = welford(range(window - 1, -1, -1))          # rows t..end
+    # the window ending at row t of a block starts at row t+1 of the block
+    # before; it lies wholly in its own block when t is the last row
+    n_a, mu_a, m2_a = np.zeros((3, n_blk, window, k))
+    n_a[1:, :-1], mu_a[1:, :-1], m2_a[1:, :-1] = suffix[:, :-1, 1:]
+
+    cnt   = n_a + n_b
+    delta = mu_b - mu_a
+    with np.errstate(invalid="ignore", divide="ignore"):
+        m2 = m2_a + m2_b + delta*delta * (n_a*n_b / cnt)
+        out = np.sqrt(m2 / (cnt - 1)).reshape(-1, k)[:n]
+    out[cnt.reshape(-1, k)[:n] < max(min_periods, 2)] = np.nan
+    return out
+
+# -------------------------------------------------------------------
+# bid-change kernel
+# -------------------------------------------------------------------
+def bid_change(arr, new_run, nan_counts=False):
+    """int8 flag: 1 where a row's bands differ from the previous row.
+
+    `arr` is the (rows x bands) matrix sorted by key then time; `new_run`
+    is True on the first row of each key run. Columns are compared one at
+    a time through a single reusable buffer, so no rows x bands
+    temporary is built.
+    nan_counts=False : NaN differences and run starts never count
+                       (diff().abs().gt(0) semantics)
+    nan_counts=True  : both always count (diff().ne(0) semantics)
+    """
+    arr = np.asfortranarray(arr)
+    hit = np.zeros(len(arr), dtype=bool)
+    buf = np.empty(max(len(arr) - 1, 0), dtype=arr.dtype)
+    for j in range(arr.shape[1]):
+        np.subtract(arr[1:, j], arr[:-1, j], out=buf)
+        if nan_counts:
+            hit[1:] |= buf != 0
+        else:
+            np.abs(buf, out=buf)
+            hit[1:] |= buf > 0
+    hit[new_run] = nan_counts
+    return hit.astype(np.int8)
+
+# -------------------------------------------------------------------
+# grouped lead
+# -------------------------------------------------------------------
+def grouped_lead(values, keys, periods):
+    """values[i+periods] when that row shares row i's key, else NaN.
+
+    Rows must be sorted by key then time; equals
+    groupby(keys).shift(-periods) without the per-group pass.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    keys   = np.asarray(keys)
+    out = np.full(len(values), np.nan)
+    if len(values) > periods:
+        same = keys[periods:] == keys[:-periods]
+        out[:-periods] = np.where(same, values[periods:], np.nan)
+    return out
+
+# -------------------------------------------------------------------
+# bid-change flags per DUID×BIDTYPE (energy-only scripts)
+# -------------------------------------------------------------------
+def build_bidflags(folder, months, duids):
+    """INTERVAL, DUID, BIDTYPE, Bid_change from bidperoffer_<month>.csv.
+
+    Any band differing from the previous interval of the same DUID×BIDTYPE
+    counts as a change; the first row of each pair and NaN bands never do.
+    Memoised on the month files' mtimes; each caller gets its own copy.
+    """
+    folder = Path(folder)
+    stamps = tuple((folder/f"bidperoffer_{m}.csv").stat().st_mtime_ns
+                   for m in months)
+    return _own(_bidflags(folder, tuple(months), tuple(duids), stamps))
+
+@functools.lru_cache(maxsize=2)
+def _bidflags(folder, months, duids, stamps):
+    # only the flags are memoised; the month scans are not
+    avail_cols = [f"BANDAVAIL{i}" for i in range(1, 11)]
+    bids = read_csv_months([folder/f"bidperoffer_{m}.csv" for m in months],
+                           parse_dates=["INTERVAL_DATETIME"],
+                           columns=["INTERVAL_DATETIME", "DUID", "BIDTYPE"]
+                                   + avail_cols,
+                           duids=duids)
+    bids = bids.astype({c: np.float32 for c in avail_cols})
+    bids.rename(columns={"INTERVAL_DATETIME": "INTERVAL"}, inplace=True)
+    # categorical keys after the concat, so every month shares one dictionary
+    bids = bids.astype({"DUID": pd.CategoricalDtype(sorted(duids)),
+                        "BIDTYPE": "category"})
+    bids.sort_values(["DUID", "BIDTYPE", "INTERVAL"], inplace=True)
+
+    duid  = bids["DUID"].cat.codes.to_numpy()
+    btype = bids["BIDTYPE"].cat.codes.to_numpy()
+    new_run = np.r_[True, (duid[1:] != duid[:-1]) | (btype[1:] != btype[:-1])]
+    bids["Bid_change"] = bid_change(bids[avail_cols].to_numpy(), new_run)
+    return bids[["INTERVAL", "DUID", "BIDTYPE", "Bid_change"]]
@@ -2,6 +2,10 @@
 """
 Extract BIDPEROFFER_D band availability for January 2022
 for a selected set of DUID prefixes, and save to price_bands/bidperoffer_Jan2022.csv.
+
+The result is also written as zstd-compressed Parquet with float32 bands
+and dictionary-encoded DUID / BIDTYPE; the CSV stays on by default
+because the logit scripts read it.
 """
 
 import os
@@ -26,12 +30,16 @@ END_TIME   = "2019/11/01 00:00:00"
 TABLE_NAME = "BIDPEROFFER_D"
 
 # Columns to extract
+BAND_COLUMNS = [f"BANDAVAIL{i}" for i in range(1, 11)]
 SELECT_COLUMNS = [
     "SETTLEMENTDATE",
     "INTERVAL_DATETIME",
     "DUID",
     "BIDTYPE",
-] + [f"BANDAVAIL{i}" for i in range(1, 11)]
+] + BAND_COLUMNS
+
+# Also write the CSV copy next to the Parquet output
+WRITE_CSV = True
 
 # DUID prefixes of interest
 PREFIXES = (
@@ -63,16 +71,33 @@ print(f"Retrieved total rows: {len(df):,}")
 
 # ─── 3. Filter by DUID prefix ───────────────────────────────────────────────
 
-mask = df["DUID"].str.startswith(PREFIXES)
-df_filtered = df.loc[mask, SELECT_COLUMNS].reset_index(drop=True)
+# Prefixes are tested once per distinct unit, not once per row
+duids = df["DUID"].unique()
+keep  = [d for d in duids if isinstance(d, str) and d.startswith(PREFIXES)]
+mask  = df["DUID"].isin(keep)
+
+# Sorted by unit, bid type and interval so downstream readers only need a
+# stable sort on the two keys after concatenating months
+df_filtered = (
+    df.loc[mask, SELECT_COLUMNS]
+      .astype({"DUID": "category", "BIDTYPE": "category",
+               **{c: "float32" for c in BAND_COLUMNS}})
+      .sort_values(["DUID", "BIDTYPE", "INTERVAL_DATETIME"])
+      .reset_index(drop=True)
+)
 
 print(f"Rows after filtering by prefixes {PREFIXES}: {len(df_filtered):,}")
 
 # ─── 4. Save result ─────────────────────────────────────────────────────────
 
-out_path = os.path.join(OUTPUT_DIR, "bidperoffer_october2019.csv")
-df_filtered.to_csv(out_path, index=False)
+out_path = os.path.join(OUTPUT_DIR, "bidperoffer_october2019.parquet")
+df_filtered.to_parquet(out_path, engine="pyarrow", compression="zstd",
+                       index=False)
 print(f"Saved filtered data to {out_path}")
+if WRITE_CSV:
+    csv_path = os.path.splitext(out_path)[0] + ".csv"
+    df_filtered.to_csv(csv_path, index=False)
+    print(f"Saved CSV copy to {csv_path}")
 
 # ─── 5. Show first few rows ────────────────────────────────────────────────
 
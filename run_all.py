@@ -0,0 +1,25 @@
+"""
+run_all.py
+fit the difference-in-differences logits in one process
+---------------------------------------------------------
+Runs logit_diff_in_diff.py, logit_signed_did.py, logit_stacked_did.py and
+logit_stacked_volatility.py in sequence. pipeline.py memoises the load and
+price frames and the energy bid-change flags, so those are read once here
+rather than once per script; the raw bid months are not kept between
+scripts.
+"""
+
+import gc
+import runpy
+
+SCRIPTS = ["logit_diff_in_diff.py",
+           "logit_signed_did.py",
+           "logit_stacked_did.py",
+           "logit_stacked_volatility.py"]
+
+for script in SCRIPTS:
+    print(f"\n######## {script} ########")
+    runpy.run_path(script, run_name="__main__")
+    # fitted results hold reference cycles; free the previous model's
+    # design matrix before the next script builds its own
+    gc.collect()
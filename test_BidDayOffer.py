@@ -0,0 +1,58 @@
+"""Trading-day window of BidDayOffer.read_cached_month.
+
+Run with:  python -m pytest test_BidDayOffer.py
+"""
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+pytest.importorskip("nemosis")
+
+SETTLEMENT_DATES = ["2019/10/30", "2019/10/31", "2019/11/01",
+                    "2019/11/30", "2019/12/01"]
+
+
+@pytest.fixture
+def bdo(tmp_path, monkeypatch):
+    # the script creates its cache and output folders on import
+    monkeypatch.chdir(tmp_path)
+    import BidDayOffer
+    return BidDayOffer
+
+
+def write_cache(path, duid):
+    """One nemosis-style cache file: dates as text, one row per trading day."""
+    n = len(SETTLEMENT_DATES)
+    table = pa.table({
+        "SETTLEMENTDATE": [f"{d} 00:00:00" for d in SETTLEMENT_DATES],
+        "OFFERDATE": ["2019/10/01 12:00:00"] * n,
+        "DUID": [duid] * n,
+        "BIDTYPE": ["ENERGY"] * n,
+        **{c: [float(i) for i in range(n)] for c in
+           [f"PRICEBAND{i}" for i in range(1, 11)]},
+    })
+    pq.write_table(table, path)
+    return path
+
+
+def test_window_matches_nemosis_dispatch_date_setup(bdo):
+    start, end = bdo.trading_window(*bdo.month_iter(bdo.START_DATE,
+                                                    bdo.END_DATE)[0])
+    assert start == pd.Timestamp("2019-10-30 23:59:59")
+    assert end == pd.Timestamp("2019-11-30 00:00:00")
+
+
+def test_first_of_month_survives(bdo, tmp_path):
+    files = [write_cache(tmp_path / "cache.parquet", "QPS1"),
+             write_cache(tmp_path / "other.parquet", "NOT_OURS")]
+    month_start, month_end = bdo.month_iter(bdo.START_DATE, bdo.END_DATE)[0]
+
+    table = bdo.read_cached_month(files, month_start, month_end)
+
+    kept = pd.Series(table.column("SETTLEMENTDATE").to_pandas())
+    assert kept.tolist() == [pd.Timestamp("2019-10-31"),
+                             pd.Timestamp("2019-11-01"),
+                             pd.Timestamp("2019-11-30")]
+    assert set(table.column("DUID").to_pylist()) == {"QPS1"}